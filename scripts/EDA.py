@@ -1,163 +1,95 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+import argparse
+from trip_store import DAY_NAMES, MONTH_NAMES, load_trips
+from trip_cube import load_cube, rollup
+from od_matrix import load_od, top_routes as busiest_routes
+from station_dictionary import load_dictionary
+from charts import ChartSpec, bin_counts, render_all
+from density import DURATION_BIN_MIN, histogram_curve
+import profiling
 
 save_folder = "visuals/eda"
-os.makedirs(save_folder, exist_ok=True)
 
-# Setup for prettier plot
-sns.set(style="whitegrid")
-plt.rcParams["figure.figsize"] = (10, 6)
-
-# Load the cleaned combined CSV
-DATA_PATH = "data/processed/bikeshare_2023_combined.csv"
-df = pd.read_csv(DATA_PATH)
-
-print(f"Original shape: {df.shape}")
-df.dropna(inplace=True)
-print(f"New shape after dropping NaNs: {df.shape}")
-
-# Standardize column names
-df.columns = (
-    df.columns
-    .str.strip()
-    .str.lower()
-    .str.replace(" ", "_")
-    .str.replace("__", "_")
-)
-
-print(f"Data Loaded: {df.shape[0]:,} rows, {df.shape[1]} columns")
-print("Columns: ", list(df.columns))
-
-# Convert to datatime
-df["start_time"] = pd.to_datetime(df["start_time"], errors="coerce")
-df["end_time"] = pd.to_datetime(df["end_time"], errors="coerce")
-
-# Add time-related features
-df["hour"] = df["start_time"].dt.hour
-df["day_of_week"] = df["start_time"].dt.day_name()
-df["month"] = df["start_time"].dt.month_name()
-
-print("Null start time:", df["start_time"].isna().sum())
-
-day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-month_order = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
-
-sns.histplot(df["trip_duration"] / 60, bins=100, kde=True)
-plt.title("Trip Duration Distribution (minutes)")
-plt.xlabel("Duration (minutes)")
-plt.ylabel("Number of Trips")
-plt.xlim(0, 60)
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trip_duration_dist.png"))
-plt.clf()
-
-sns.countplot(x="hour", data=df, order=sorted(df["hour"].dropna().unique()))
-plt.title("Trips by Hour of Day")
-plt.xlabel("Hour")
-plt.ylabel("Number of Trips")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trips_by_hour.png"))
-plt.clf()
-
-sns.countplot(x="day_of_week", data=df, order=day_order)
-plt.title("Trips by Day of Week")
-plt.xlabel("Day")
-plt.ylabel("Number of Trips")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trips_by_day.png"))
-plt.clf()
-
-sns.countplot(x="user_type", data=df)
-plt.title("Trips by User Type")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "user_type_breakdown.png"))
-plt.clf()
-
-top_stations = df["start_station_name"].value_counts().nlargest(10)
-sns.barplot(y=top_stations.index, x=top_stations.values)
-plt.title("Top 10 Start Stations")
-plt.xlabel("Number of Trips")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "top_start_stations.png"))
-plt.clf()
-
-sns.countplot(x="month", data=df, order=month_order)
-plt.title("Trips by Month")
-plt.xlabel("Month")
-plt.ylabel("Number of Trips")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trips_by_month.png"))
-plt.clf()
-
-df["route"] = df["start_station_name"] + " -> " + df["end_station_name"]
-top_routes = df["route"].value_counts().head(10)
-plt.figure(figsize=(12, 6))
-sns.barplot(x=top_routes.values,
-            y=top_routes.index,
-            hue=top_routes.index,
-            palette="viridis",
-            dodge=False,
-            legend=False)
-plt.title("Top 10 Most Frequent Bike Routes")
-plt.xlabel("Number of Trips")
-plt.ylabel("Route")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "top_10_routes.png"))
-plt.clf()
-
-plt.figure(figsize=(10, 6))
-sns.countplot(
-    data=df,
-    x="day_of_week",
-    hue="user_type",
-    order=day_order,
-    palette="Set2"
-)
-plt.title("Trips by Day of the Week (Grouped by User Type)")
-plt.xlabel("Day of Week")
-plt.ylabel("Number of Trips")
-plt.legend(title="User Type")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trips_by_day_user_type.png"))
-plt.clf()
-
-months_to_keep = ["January", "February", "March", "April", "May", "June", "July", "August"]
-filtered_df = df[df["month"].isin(months_to_keep)]
-
-plt.figure(figsize=(12, 6))
-sns.countplot(
-    data=filtered_df,
-    x="month",
-    hue="user_type",
-    order=months_to_keep,
-    palette="Set2"
-)
-
-plt.title("Trips by Month (Grouped by User Type)")
-plt.xlabel("Month")
-plt.ylabel("Number of Trips")
-plt.legend(title="User Type")
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trips_by_month_user_type.png"))
-plt.clf()
-
-plt.figure(figsize=(12, 6))
-sns.countplot(
-    data=df,
-    x="hour",
-    hue="user_type",
-    palette="Set2"
-)
-
-plt.title("Trips by Hour of Day (Grouped by User Type)")
-plt.xlabel("Hour (0–23)")
-plt.ylabel("Number of Trips")
-plt.legend(title="User Type")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trips_by_hour_user_type.png"))
-plt.clf()
-
-print("EDA plots are saved to visuals folder")
\ No newline at end of file
+# Trip columns this analysis reads from the processed trip store; everything
+# else is rendered from the pre-aggregated trip cube and OD matrix
+COLUMNS = ["trip_duration"]
+
+day_order = DAY_NAMES
+month_order = MONTH_NAMES
+
+def chart_specs(df, cube):
+    """One chart spec per EDA figure, each drawn from a small aggregate of the trips."""
+    duration_min = df["trip_duration"].to_numpy(dtype="float64") / 60
+    duration_bins, duration_edges = bin_counts(duration_min, bins=100)
+    by_hour = rollup(cube, ["hour"])
+    top_stations = rollup(cube, ["start_station_name"]).nlargest(10, "trips")
+    top_stations["start_station_name"] = top_stations["start_station_name"].astype(str)
+    routes = busiest_routes(load_od(), 10, load_dictionary())
+    routes["route"] = routes["start_station_name"] + " -> " + routes["end_station_name"]
+
+    # Only months every user type has trips in, so partial months do not skew the comparison
+    by_month = rollup(cube, ["month", "user_type"])
+    user_types_per_month = by_month.groupby("month", observed=True)["user_type"].nunique()
+    months_to_keep = [month for month in month_order
+                      if user_types_per_month.get(month, 0) == by_month["user_type"].nunique()]
+
+    return [
+        ChartSpec("hist", duration_bins, os.path.join(save_folder, "trip_duration_dist.png"),
+                  "Trip Duration Distribution (minutes)", xlabel="Duration (minutes)", ylabel="Number of Trips",
+                  style={"bins": duration_edges},
+                  layout={"curve": histogram_curve(duration_min, duration_edges, DURATION_BIN_MIN), "xlim": (0, 60)}),
+        ChartSpec("bar", by_hour, os.path.join(save_folder, "trips_by_hour.png"),
+                  "Trips by Hour of Day", x="hour", y="trips",
+                  order=sorted(by_hour["hour"].unique()), xlabel="Hour", ylabel="Number of Trips"),
+        ChartSpec("bar", rollup(cube, ["day_of_week"]), os.path.join(save_folder, "trips_by_day.png"),
+                  "Trips by Day of Week",
+                  x="day_of_week", y="trips", order=day_order, xlabel="Day", ylabel="Number of Trips"),
+        ChartSpec("bar", rollup(cube, ["user_type"]), os.path.join(save_folder, "user_type_breakdown.png"),
+                  "Trips by User Type", x="user_type", y="trips"),
+        ChartSpec("bar", top_stations, os.path.join(save_folder, "top_start_stations.png"), "Top 10 Start Stations",
+                  x="trips", y="start_station_name", xlabel="Number of Trips"),
+        ChartSpec("bar", rollup(cube, ["month"]), os.path.join(save_folder, "trips_by_month.png"), "Trips by Month",
+                  x="month", y="trips", order=month_order, xlabel="Month", ylabel="Number of Trips"),
+        ChartSpec("bar", routes, os.path.join(save_folder, "top_10_routes.png"), "Top 10 Most Frequent Bike Routes",
+                  x="trips", y="route", hue="route", xlabel="Number of Trips", ylabel="Route", figsize=(12, 6),
+                  style={"palette": "viridis", "dodge": False, "legend": False}),
+        ChartSpec("bar", rollup(cube, ["day_of_week", "user_type"]),
+                  os.path.join(save_folder, "trips_by_day_user_type.png"),
+                  "Trips by Day of the Week (Grouped by User Type)", x="day_of_week", y="trips", hue="user_type",
+                  order=day_order, xlabel="Day of Week", ylabel="Number of Trips",
+                  style={"palette": "Set2"}, layout={"legend_title": "User Type"}),
+        ChartSpec("bar", by_month[by_month["month"].isin(months_to_keep)],
+                  os.path.join(save_folder, "trips_by_month_user_type.png"),
+                  "Trips by Month (Grouped by User Type)", x="month", y="trips", hue="user_type",
+                  order=months_to_keep, xlabel="Month", ylabel="Number of Trips", figsize=(12, 6),
+                  style={"palette": "Set2"}, layout={"legend_title": "User Type", "xticks_rotation": 45}),
+        ChartSpec("bar", rollup(cube, ["hour", "user_type"]), os.path.join(save_folder, "trips_by_hour_user_type.png"),
+                  "Trips by Hour of Day (Grouped by User Type)", x="hour", y="trips", hue="user_type",
+                  xlabel="Hour (0–23)", ylabel="Number of Trips", figsize=(12, 6),
+                  style={"palette": "Set2"}, layout={"legend_title": "User Type"}),
+    ]
+
+def run(df=None, cube=None, workers=None):
+    if df is None:
+        df = load_trips(columns=COLUMNS)
+    if cube is None:
+        cube = load_cube()
+    os.makedirs(save_folder, exist_ok=True)
+
+    print(f"Data Loaded: {df.shape[0]:,} rows, {df.shape[1]} columns")
+    print("Columns: ", list(df.columns))
+
+    with profiling.step("aggregate", rows=len(df)):
+        specs = chart_specs(df, cube)
+    render_all(specs, workers=workers)
+    print("EDA plots are saved to visuals folder")
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Render the exploratory charts from the trip store.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for the per-partition aggregation and chart rendering (default: one per CPU)")
+    args = parser.parse_args(argv)
+    run(workers=args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import hashlib
+import inspect
+import numpy as np
+import pandas as pd
+from fetch_data import sha256sum
+
+# One JSON entry per artifact (a pipeline stage or a chart), so stages running
+# in parallel worker processes never write the same file
+CACHE_DIR = "data/processed/artifact_cache"
+# Set to "off" to regenerate everything; an environment variable so worker
+# processes see it too
+CACHE_ENV = "BIKESHARE_CACHE"
+
+def disable():
+    """Treat every artifact as stale in this process and its future workers (e.g. --force, benchmarks)."""
+    os.environ[CACHE_ENV] = "off"
+
+def enabled():
+    return os.environ.get(CACHE_ENV, "on") != "off"
+
+def digest(value):
+    """Stable sha256 of parameters or chart data: DataFrames, arrays, containers and scalars."""
+    h = hashlib.sha256()
+    _update(h, value)
+    return h.hexdigest()
+
+def _update(h, value):
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        h.update(repr((list(value.columns), [str(dtype) for dtype in value.dtypes])).encode())
+        h.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        h.update(b"{")
+        for key in sorted(value, key=repr):
+            _update(h, key)
+            _update(h, value[key])
+        h.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        h.update(b"[")
+        for item in value:
+            _update(h, item)
+        h.update(b"]")
+    else:
+        h.update(repr(value).encode())
+
+def path_digest(path):
+    """Content hash of a file; for a directory (e.g. the partitioned trip store)
+    a hash of its file listing with sizes and modification times, so large
+    partitions are never re-read. None if the path does not exist."""
+    if os.path.isfile(path):
+        return sha256sum(path)
+    if not os.path.isdir(path):
+        return None
+    listing = []
+    for directory, _, files in os.walk(path):
+        for file in files:
+            file_path = os.path.join(directory, file)
+            stat = os.stat(file_path)
+            listing.append((os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns))
+    return digest(sorted(listing))
+
+def local_modules(module):
+    """The module plus every module from its directory that it uses, directly or indirectly."""
+    root = os.path.dirname(os.path.abspath(module.__file__))
+    found = {}
+    pending = [module]
+    while pending:
+        current = pending.pop()
+        if current.__name__ in found:
+            continue
+        found[current.__name__] = current
+        for value in vars(current).values():
+            dependency = value if inspect.ismodule(value) else sys.modules.get(getattr(value, "__module__", None) or "")
+            path = getattr(dependency, "__file__", None)
+            if path and os.path.dirname(os.path.abspath(path)) == root:
+                pending.append(dependency)
+    return [found[name] for name in sorted(found)]
+
+def code_digest(modules):
+    """Hash of the modules' source, so editing a script (or a constant in it) invalidates its artifacts."""
+    return digest([(module.__name__, inspect.getsource(module)) for module in modules])
+
+def fingerprint(inputs=(), params=None, code=()):
+    """Fingerprint of an artifact: its input files/directories, parameters and code."""
+    return digest({
+        "inputs": {path: path_digest(path) for path in inputs},
+        "params": params,
+        "code": code_digest(code),
+    })
+
+def _entry_path(key, cache_dir):
+    return os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest()[:16] + ".json")
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def is_fresh(key, fingerprint, cache_dir=CACHE_DIR):
+    """True if `key` was last built with this fingerprint and its outputs are
+    still the files it wrote (same size and modification time)."""
+    path = _entry_path(key, cache_dir)
+    if not enabled() or not os.path.exists(path):
+        return False
+    with open(path) as f:
+        entry = json.load(f)
+    outputs = entry["outputs"]
+    if entry["fingerprint"] != fingerprint or not isinstance(outputs, dict):
+        return False
+    return all(os.path.exists(output) and _file_stat(output) == stat for output, stat in outputs.items())
+
+def _output_files(outputs):
+    files = []
+    for output in outputs:
+        if os.path.isdir(output):
+            files.extend(os.path.join(directory, file) for directory, _, names in os.walk(output) for file in names)
+        elif os.path.exists(output):
+            files.append(output)
+    return sorted(files)
+
+def record(key, fingerprint, outputs, params=None, cache_dir=CACHE_DIR):
+    """Remember that `key` built `outputs` (files or directories) with this
+    fingerprint, and the size and modification time of every file in them."""
+    os.makedirs(cache_dir, exist_ok=True)
+    files = {file: _file_stat(file) for file in _output_files(outputs)}
+    entry = {"key": key, "fingerprint": fingerprint, "params": params, "outputs": files}
+    with open(_entry_path(key, cache_dir), "w") as f:
+        json.dump(entry, f, indent=2, default=str)
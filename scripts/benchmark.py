@@ -0,0 +1,175 @@
+import os
+import json
+import queue
+import argparse
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+
+import synthetic_data
+import profiling
+import artifact_cache
+
+RESULTS_PATH = "benchmarks/results.jsonl"
+
+def _ingest():
+    import clean_data
+    from trip_store import TRIPS_PATH
+    clean_data.ingest_all_csvs(clean_data.default_raw_sources(), TRIPS_PATH)
+
+def _aggregate():
+    import trip_cube
+    import od_matrix
+    import net_flow
+    trip_cube.build_cube()
+    od_matrix.build_od_store()
+    net_flow.build_net_flow()
+
+def _eda():
+    import EDA
+    EDA.run()
+
+def _trip_duration():
+    import trip_duration_visuals
+    trip_duration_visuals.run()
+
+def _station_imbalance():
+    import station_imbalance_analysis
+    station_imbalance_analysis.run()
+
+def _cluster():
+    import cluster_analysis
+    cluster_analysis.run()
+
+def _spatial():
+    import spatial_usage
+    spatial_usage.run()
+
+# Benchmarked stages in pipeline order; each depends on the outputs of the earlier ones
+BENCHMARKS = {
+    "ingest": _ingest,
+    "aggregate": _aggregate,
+    "eda": _eda,
+    "trip_duration": _trip_duration,
+    "station_imbalance": _station_imbalance,
+    "cluster": _cluster,
+    "spatial": _spatial,
+}
+
+def _measure(name, workdir, results):
+    """Run one benchmark in this (fresh) process and report its wall/CPU time, peak memory and sub-steps."""
+    os.chdir(workdir)
+    # Every run must do the full work, not reuse the previous run's outputs
+    artifact_cache.disable()
+    with profiling.step(name) as record:
+        BENCHMARKS[name]()
+    results.put({
+        "seconds": round(record["wall_s"], 3),
+        "cpu_seconds": round(record["cpu_s"], 3),
+        # Peak RSS of the largest single process: this fresh one or one of its
+        # workers (RUSAGE_CHILDREN reports a maximum, not a sum), so stages with
+        # worker pools use more memory in total than this
+        "largest_process_mb": record["process_peak_mb"],
+        "steps": profiling.records(),
+    })
+
+def run_benchmark(name, workdir):
+    """Run a benchmark in a freshly spawned interpreter so its peak memory is its own."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(name, os.path.abspath(workdir), results))
+    process.start()
+    # Read the result before joining: a child cannot exit while its queued
+    # result is larger than the pipe buffer and nobody reads it
+    result = None
+    while result is None and (process.is_alive() or not results.empty()):
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            pass
+    process.join()
+    if process.exitcode != 0 or result is None:
+        raise RuntimeError(f"Benchmark {name} failed with exit code {process.exitcode}")
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def previous_run(params, path=RESULTS_PATH):
+    """Most recent saved run with the same dataset parameters, if any."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    matching = [run for run in runs if run["params"] == params]
+    return matching[-1] if matching else None
+
+def print_results(run, baseline=None):
+    print(f"{'stage':<18}{'seconds':>10}{'max proc MB':>13}{'vs last':>10}")
+    for name, result in run["stages"].items():
+        change = ""
+        if baseline and name in baseline["stages"] and baseline["stages"][name]["seconds"]:
+            change = f"{result['seconds'] / baseline['stages'][name]['seconds'] - 1:+.0%}"
+        print(f"{name:<18}{result['seconds']:>10.2f}{result['largest_process_mb']:>13.1f}{change:>10}")
+
+def run_suite(rows=1_000_000, n_stations=600, skew=1.0, stages=None, workdir=synthetic_data.SYNTHETIC_ROOT,
+              regenerate=False, results_path=RESULTS_PATH):
+    """Generate (or reuse) a synthetic dataset, benchmark every stage on it and append the results."""
+    params = {"rows": rows, "stations": n_stations, "skew": skew}
+    params_path = os.path.join(workdir, "params.json")
+    existing = None
+    if os.path.exists(params_path):
+        with open(params_path) as f:
+            existing = json.load(f)
+    if regenerate or existing != params:
+        print(f"Generating {rows:,} synthetic trips over {n_stations} stations...")
+        synthetic_data.write_dataset(workdir, rows, n_stations, skew)
+        with open(params_path, "w") as f:
+            json.dump(params, f)
+
+    baseline = previous_run(params, results_path)
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "params": params,
+        "stages": {},
+    }
+    for name in stages or BENCHMARKS:
+        print(f"⏱  {name}")
+        run["stages"][name] = run_benchmark(name, workdir)
+
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    with open(results_path, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    print_results(run, baseline)
+    print(f"Benchmark results appended to {results_path}")
+    return run
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog,
+                                     description="Benchmark every pipeline stage on synthetic ridership data.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Synthetic trips (1M to 50M)")
+    parser.add_argument("--stations", type=int, default=600)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of station popularity")
+    parser.add_argument("--stages", default=",".join(BENCHMARKS),
+                        help="Comma-separated stages; later stages need the outputs of earlier ones")
+    parser.add_argument("--workdir", default=synthetic_data.SYNTHETIC_ROOT)
+    parser.add_argument("--regenerate", action="store_true", help="Regenerate the dataset even if it matches")
+    parser.add_argument("--profile", default=None,
+                        help="Comma-separated steps to run under cProfile, e.g. ingest or cluster/kmeans")
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.enable_cprofile(args.profile.split(","))
+
+    stage_names = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = [name for name in stage_names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(unknown)}")
+
+    run_suite(args.rows, args.stations, args.skew, stage_names, args.workdir, args.regenerate)
+
+if __name__ == "__main__":
+    main()
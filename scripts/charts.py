@@ -0,0 +1,129 @@
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+
+import numpy as np
+import pandas as pd
+import artifact_cache
+import profiling
+
+# A chart to render: the kind of plot, the small pre-aggregated table it is
+# drawn from, where to save it, and how it looks. `style` goes to the
+# seaborn call; `layout` holds figure-level options (curve, xlim, axvline,
+# xticks_rotation, legend_title, legend).
+ChartSpec = namedtuple(
+    "ChartSpec",
+    ["kind", "data", "path", "title", "x", "y", "hue", "order", "xlabel", "ylabel", "figsize", "style", "layout"],
+    defaults=[None, None, None, None, None, None, (10, 6), {}, {}],
+)
+
+def bin_counts(values, bins, range=None):
+    """Histogram of `values` as a small table (bin centers + counts) and the bin edges."""
+    values = np.asarray(values, dtype="float64")
+    counts, edges = np.histogram(values, bins=bins, range=range)
+    return pd.DataFrame({"value": (edges[:-1] + edges[1:]) / 2, "count": counts}), edges
+
+def _pyplot():
+    """matplotlib.pyplot and seaborn, imported on the first render so scripts
+    whose charts are all up to date never pay for them."""
+    import matplotlib
+    matplotlib.use("Agg")  # Charts are rendered headless, possibly in worker processes
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+def _bar(sns, ax, spec):
+    sns.barplot(data=spec.data, x=spec.x, y=spec.y, hue=spec.hue, order=spec.order, ax=ax, **spec.style)
+
+def _hist(sns, ax, spec):
+    # Pre-binned: one row per bin center, weighted by its count. Edges are
+    # passed as a list; seaborn compares `bins` to "auto" when weights are set
+    style = dict(spec.style)
+    if isinstance(style.get("bins"), np.ndarray):
+        style["bins"] = style["bins"].tolist()
+    sns.histplot(data=spec.data, x="value", weights="count", hue=spec.hue, ax=ax, **style)
+
+def _kde(sns, ax, spec):
+    # Pre-computed density curves (density.grouped_kde): one line per hue group
+    sns.lineplot(data=spec.data, x="value", y="density", hue=spec.hue, ax=ax, **spec.style)
+
+def _line(sns, ax, spec):
+    sns.lineplot(data=spec.data, x=spec.x, y=spec.y, hue=spec.hue, ax=ax, **spec.style)
+
+def _box(sns, ax, spec):
+    # Pre-computed statistics, e.g. duration_sketch.box_stats
+    ax.bxp(spec.data, patch_artist=True, **spec.style)
+    palette = sns.color_palette(n_colors=len(spec.data))
+    for patch, color in zip(ax.patches, palette):
+        patch.set_facecolor(color)
+
+DRAW = {"bar": _bar, "hist": _hist, "kde": _kde, "line": _line, "box": _box}
+
+def render(spec):
+    """Draw one chart spec and save it as a PNG; returns the saved path."""
+    plt, sns = _pyplot()
+    sns.set(style="whitegrid")
+    fig, ax = plt.subplots(figsize=spec.figsize)
+    DRAW[spec.kind](sns, ax, spec)
+
+    if spec.title:
+        ax.set_title(spec.title)
+    if spec.xlabel is not None:
+        ax.set_xlabel(spec.xlabel)
+    if spec.ylabel is not None:
+        ax.set_ylabel(spec.ylabel)
+    layout = spec.layout
+    if "curve" in layout:
+        # Overlay for histograms, e.g. density.histogram_curve
+        x, y = layout["curve"]
+        ax.plot(x, y, color=ax.patches[0].get_facecolor()[:3] if ax.patches else None)
+    if "xlim" in layout:
+        ax.set_xlim(*layout["xlim"])
+    if "axvline" in layout:
+        ax.axvline(**layout["axvline"])
+    if "xticks_rotation" in layout:
+        ax.tick_params(axis="x", labelrotation=layout["xticks_rotation"])
+    if "legend_title" in layout:
+        legend = ax.get_legend()
+        if legend is not None:
+            legend.set_title(layout["legend_title"])
+        else:
+            ax.legend(title=layout["legend_title"])
+    if layout.get("legend"):
+        ax.legend()
+
+    os.makedirs(os.path.dirname(spec.path) or ".", exist_ok=True)
+    fig.tight_layout()
+    fig.savefig(spec.path)
+    plt.close(fig)
+    return spec.path
+
+def chart_fingerprint(spec):
+    """Fingerprint of a chart: its spec (data table included), this module and the plotting libraries."""
+    return artifact_cache.digest([
+        spec, artifact_cache.code_digest([sys.modules[__name__]]), version("matplotlib"), version("seaborn"),
+    ])
+
+def render_all(specs, workers=None):
+    """Render chart specs across a process pool (workers=1 renders in this process).
+
+    Charts whose spec is unchanged since they were last saved are skipped.
+    Returns the paths of every chart, rendered or not.
+    """
+    specs = list(specs)
+    fingerprints = [chart_fingerprint(spec) for spec in specs]
+    stale = [(spec, fp) for spec, fp in zip(specs, fingerprints) if not artifact_cache.is_fresh(spec.path, fp)]
+    with profiling.step("render", rows=len(stale)):
+        if workers == 1 or len(stale) <= 1:
+            for spec, _ in stale:
+                render(spec)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(render, [spec for spec, _ in stale]))
+    for spec, fp in stale:
+        artifact_cache.record(spec.path, fp, [spec.path])
+    if len(stale) < len(specs):
+        print(f"{len(specs) - len(stale)} of {len(specs)} chart(s) up to date, skipped")
+    return [spec.path for spec in specs]
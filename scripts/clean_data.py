@@ -1,37 +1,302 @@
 import os
+import re
+import shutil
+import zipfile
+import argparse
 import pandas as pd
+import pyarrow.parquet as pq
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from trip_store import (
+    TRIPS_PATH, TRIP_SCHEMA, READ_DTYPES, normalize_columns, apply_schema,
+    ROW_GROUP_SIZE, drop_invalid_trips, with_time_features, to_arrow, partition_key, partition_path, write_partition,
+    replace_store, sort_partition,
+)
+from station_dictionary import encode_store, load_dictionary, with_station_codes
+import profiling
 
-RAW_DATA_PATH = "data/raw/bikeshare-ridership-2023"
-PROCESSED_DATA_PATH = "data/processed"
-OUTPUT_FILE = os.path.join(PROCESSED_DATA_PATH, "bikeshare_2023_combined.csv")
+RAW_DATA_DIR = "data/raw"
+# One extracted folder or downloaded archive per year of ridership
+RAW_FOLDER_PATTERN = re.compile(r"bikeshare-ridership-(\d{4})$")
+RAW_ZIP_PATTERN = re.compile(r"bikeshare_(\d{4})\.zip$")
+
+# A CSV inside an archive is addressed as "<zip path>!<member name>"
+ZIP_MEMBER_SEP = "!"
+
+# Streaming mode: rough bytes held per raw row across the raw chunk, its typed
+# copy and the Arrow table being written
+MEMORY_OVERHEAD_FACTOR = 4
+SAMPLE_ROWS = 10_000
+
+def default_raw_sources(raw_dir=RAW_DATA_DIR):
+    """One source per year under data/raw, oldest first: the extracted CSV
+    folder if present, otherwise the downloaded archive."""
+    sources = {}
+    entries = sorted(os.listdir(raw_dir)) if os.path.isdir(raw_dir) else []
+    for entry in entries:
+        path = os.path.join(raw_dir, entry)
+        folder = RAW_FOLDER_PATTERN.match(entry)
+        archive = RAW_ZIP_PATTERN.match(entry)
+        if folder and os.path.isdir(path):
+            sources[folder.group(1)] = path
+        elif archive and folder is None:
+            sources.setdefault(archive.group(1), path)
+    return [sources[year] for year in sorted(sources)]
+
+def list_monthly_csvs(raw_path):
+    """Monthly CSV sources in a folder or directly inside a zip archive.
+
+    `raw_path` may also be a list of folders / archives, e.g. one per year.
+    """
+    if isinstance(raw_path, (list, tuple)):
+        return [source for path in raw_path for source in list_monthly_csvs(path)]
+    if zipfile.is_zipfile(raw_path):
+        with zipfile.ZipFile(raw_path) as archive:
+            members = [
+                m for m in archive.namelist()
+                if m.endswith(".csv") and not m.startswith("__MACOSX/")
+            ]
+        members.sort(key=os.path.basename)
+        return [f"{raw_path}{ZIP_MEMBER_SEP}{m}" for m in members]
 
-def load_all_csvs(raw_path):
     all_files = [f for f in os.listdir(raw_path) if f.endswith(".csv")]
     all_files.sort()  # Sort by name so Jan → Dec
+    return [os.path.join(raw_path, f) for f in all_files]
+
+@contextmanager
+def open_csv(source):
+    """Open a monthly CSV, streaming it out of the archive without extracting it."""
+    if ZIP_MEMBER_SEP in source and not os.path.exists(source):
+        zip_path, member = source.split(ZIP_MEMBER_SEP, 1)
+        with zipfile.ZipFile(zip_path) as archive, archive.open(member) as f:
+            yield f
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+def source_fingerprint(source):
+    """Size plus mtime (files) or CRC (zip members), used to detect changed months."""
+    if ZIP_MEMBER_SEP in source and not os.path.exists(source):
+        zip_path, member = source.split(ZIP_MEMBER_SEP, 1)
+        with zipfile.ZipFile(zip_path) as archive:
+            info = archive.getinfo(member)
+        return {"size": info.file_size, "crc": info.CRC}
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def csv_read_args(file_path):
+    """read_csv arguments that parse a monthly file against the explicit schema."""
+    with open_csv(file_path) as f:
+        header = pd.read_csv(f, encoding="ISO-8859-1", nrows=0).columns
+    names = dict(zip(header, normalize_columns(header)))
+    usecols = [raw for raw, col in names.items() if col in TRIP_SCHEMA]
+    return {
+        "encoding": "ISO-8859-1",
+        "na_values": ["NULL"],
+        "usecols": usecols,
+        "dtype": {raw: READ_DTYPES[names[raw]] for raw in usecols},
+    }
 
+def normalize_trips(df):
+    df.columns = normalize_columns(df.columns)
+    if df.columns.tolist().count('trip_id') > 1:
+        df = df.drop(columns=['trip_id'], axis=1)
+    return apply_schema(df)
+
+def read_month_csv(file_path):
+    """Parse one monthly CSV against the explicit schema instead of inferring dtypes."""
+    read_args = csv_read_args(file_path)
+    with open_csv(file_path) as f, profiling.step("read_csv") as record:
+        df = pd.read_csv(f, **read_args)
+        record["rows"] = len(df)
+    return normalize_trips(df)
+
+def load_all_csvs(raw_path):
     dataframes = []
-    for file in all_files:
-        file_path = os.path.join(raw_path, file)
+    for file_path in list_monthly_csvs(raw_path):
         print(f"Loading {file_path}")
         try:
-            df = pd.read_csv(file_path, encoding="ISO-8859-1", na_values=["NULL"])
-            df.columns = df.columns.str.strip().str.lower().str.replace('ï»¿', '').str.replace(' ', '_')
-            if df.columns.tolist().count('trip_id') > 1:
-                df = df.drop(columns=['trip_id'], axis=1)
-            dataframes.append(df)
+            dataframes.append(read_month_csv(file_path))
         except Exception as e:
             print(f" Failed to read {file_path}: {e}")
 
+    # concat falls back to object dtype when monthly categories differ
     combined_df = pd.concat(dataframes, ignore_index=True)
+    for col in combined_df.columns:
+        if TRIP_SCHEMA[col] == "category":
+            combined_df[col] = combined_df[col].astype("category")
     return combined_df
 
-def save_combined_csv(df, output_path):
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, index=False)
-    print(f"Saved combined CSV to: {output_path}")
+def partition_name(file_path):
+    return os.path.splitext(os.path.basename(file_path.split(ZIP_MEMBER_SEP)[-1]))[0]
+
+def ingest_month(file_path, output_dir=TRIPS_PATH):
+    """Parse one monthly CSV and write it straight to its own partition.
+
+    The report carries the profiling steps recorded for the month, so they
+    survive the trip back from a worker process.
+    """
+    first = len(profiling.records())
+    with profiling.step("ingest_month") as record:
+        df = read_month_csv(file_path)
+        kept, rejects = drop_invalid_trips(df)
+        kept = with_station_codes(with_time_features(kept), load_dictionary())
+        with profiling.step("write_partition"):
+            write_partition(kept, partition_name(file_path), output_dir)
+        record["rows"] = len(df)
+    return {"rows_read": len(df), "rows_written": len(kept), "rejects": rejects,
+            "steps": profiling.records()[first:]}
+
+def chunksize_for_memory(file_path, max_memory_mb):
+    """Pick a read_csv chunksize that keeps one chunk under max_memory_mb."""
+    read_args = csv_read_args(file_path)
+    with open_csv(file_path) as f:
+        sample = pd.read_csv(f, nrows=SAMPLE_ROWS, **read_args)
+    if sample.empty:
+        return SAMPLE_ROWS
+    bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+    return max(1_000, int(max_memory_mb * 2**20 / (bytes_per_row * MEMORY_OVERHEAD_FACTOR)))
+
+def stream_month(file_path, output_dir=TRIPS_PATH, chunksize=None, max_memory_mb=512):
+    """Stream one monthly CSV into its partition chunk by chunk, never holding the whole file.
+
+    Chunks arrive in file order, so a second pass over the written month
+    orders it by start time, within the same memory bound.
+    """
+    if chunksize is None:
+        chunksize = chunksize_for_memory(file_path, max_memory_mb)
+
+    report = {"rows_read": 0, "rows_written": 0, "rejects": Counter()}
+    read_args = csv_read_args(file_path)
+    dictionary = load_dictionary()
+    writer = None
+    # Chunks go to temporary files that only become the partition once the
+    # whole month is written and sorted, so a failure never leaves a truncated partition
+    try:
+        with open_csv(file_path) as f:
+            for chunk in pd.read_csv(f, chunksize=chunksize, **read_args):
+                chunk = normalize_trips(chunk)
+                kept, rejects = drop_invalid_trips(chunk)
+                kept = with_station_codes(with_time_features(kept), dictionary)
+                table = to_arrow(kept)
+                if writer is None:
+                    name = partition_name(file_path)
+                    output_path = partition_path(name, output_dir, partition_key(name, kept["start_time"]))
+                    unsorted_path, sorted_path = output_path + ".unsorted.tmp", output_path + ".tmp"
+                    writer = pq.ParquetWriter(unsorted_path, table.schema)
+                writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+
+                report["rows_read"] += len(chunk)
+                report["rows_written"] += len(kept)
+                report["rejects"].update(rejects)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(unsorted_path)
+        raise
+    if writer is not None:
+        writer.close()
+        try:
+            sort_partition(unsorted_path, sorted_path, chunksize)
+            os.replace(sorted_path, output_path)
+        finally:
+            for path in (unsorted_path, sorted_path):
+                if os.path.exists(path):
+                    os.remove(path)
+    report["rejects"] = dict(report["rejects"])
+    return report
+
+def ingest_all_csvs(raw_path, output_dir=TRIPS_PATH, workers=None, stream=False, chunksize=None, max_memory_mb=512):
+    """Ingest every monthly CSV into the partitioned trip store, one month per worker.
+
+    With stream=True each worker reads its month in chunks, so peak memory is
+    roughly workers * max_memory_mb regardless of file size. Months are
+    written with station codes from the current dictionary; once every month
+    is written, the dictionary is grown and only months with new stations are
+    rewritten to code them.
+
+    Months are written to a staging directory that replaces the trip store
+    only if at least one of them was ingested, so a run without sources or
+    with only failing months leaves the existing store as it was.
+    """
+    files = list_monthly_csvs(raw_path)
+    if not files:
+        raise FileNotFoundError(f"No monthly CSVs found in {raw_path}")
+    staging_dir = output_dir.rstrip(os.sep) + ".staging"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+    if stream:
+        ingest = partial(stream_month, output_dir=staging_dir, chunksize=chunksize, max_memory_mb=max_memory_mb)
+    else:
+        ingest = partial(ingest_month, output_dir=staging_dir)
+
+    if workers == 1:
+        reports = _collect((file_path, partial(ingest, file_path)) for file_path in files)
+        for report in reports.values():
+            report.pop("steps", None)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(file_path, pool.submit(ingest, file_path)) for file_path in files]
+            reports = _collect((file_path, future.result) for file_path, future in futures)
+        for report in reports.values():
+            profiling.add_records(report.pop("steps", []))
+
+    if not reports:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise RuntimeError(f"None of the {len(files)} monthly CSVs could be ingested; the trip store is unchanged")
+    with profiling.step("encode_stations"):
+        encode_store(staging_dir, workers=workers)
+    replace_store(staging_dir, output_dir)
+    return reports
+
+def _collect(results):
+    reports = {}
+    for file_path, get_report in results:
+        try:
+            reports[file_path] = get_report()
+            print(f"Loaded {file_path}: {reports[file_path]['rows_written']:,} rows")
+        except Exception as e:
+            print(f" Failed to read {file_path}: {e}")
+    return reports
+
+def print_ingest_report(reports):
+    total_read = sum(r["rows_read"] for r in reports.values())
+    total_written = sum(r["rows_written"] for r in reports.values())
+    rejects = Counter()
+    for r in reports.values():
+        rejects.update(r["rejects"])
+
+    print("\nIngest report")
+    print(f"{'file':<50} {'read':>12} {'written':>12} {'rejected':>10}")
+    for file_path, r in reports.items():
+        name = os.path.basename(file_path)
+        print(f"{name:<50} {r['rows_read']:>12,} {r['rows_written']:>12,} {r['rows_read'] - r['rows_written']:>10,}")
+    print(f"{'TOTAL':<50} {total_read:>12,} {total_written:>12,} {total_read - total_written:>10,}")
+    for reason, count in rejects.items():
+        if count:
+            print(f"  {reason}: {count:,}")
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Clean the monthly ridership CSVs into the trip store.")
+    parser.add_argument("--source", nargs="+", default=default_raw_sources(),
+                        help="Folders of monthly CSVs or downloaded zip archives (default: every year under data/raw)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of months parsed in parallel (1 = sequential)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read each file in chunks instead of all at once")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Rows per chunk in streaming mode (default: derived from --max-memory-mb)")
+    parser.add_argument("--max-memory-mb", type=int, default=512,
+                        help="Memory ceiling per worker in streaming mode")
+    args = parser.parse_args(argv)
+
+    print(f"Ingesting monthly CSVs from {', '.join(args.source)} with {args.workers} worker(s)...")
+    reports = ingest_all_csvs(args.source, TRIPS_PATH, args.workers,
+                              stream=args.stream, chunksize=args.chunksize, max_memory_mb=args.max_memory_mb)
+    print_ingest_report(reports)
+    print(f"Saved trip store to: {TRIPS_PATH}")
 
 if __name__ == "__main__":
-    print("Combining monthly CSVs into one DataFrame...")
-    df = load_all_csvs(RAW_DATA_PATH)
-    print(f"Combined DataFrame shape: {df.shape}")
-    save_combined_csv(df, OUTPUT_FILE)
\ No newline at end of file
+    main()
@@ -1,119 +1,152 @@
+import json
 import pandas as pd
-import folium
 import os
+import argparse
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
 from branca.element import MacroElement, Template
+from clustering import sweep_k
+from spatial_maps import base_map, feature_collection
+import profiling
 
 save_folder="visuals/cluster"
-os.makedirs(save_folder, exist_ok=True)
-
-# Setup for prettier plot
-sns.set(style="whitegrid")
-plt.rcParams["figure.figsize"] = (10, 6)
-
-# Load data
-df_original = pd.read_csv("data/stations_with_coords_clean.csv")
+STATIONS_PATH = "data/stations_with_coords_clean.csv"
+K = range(4, 13)
 
 # Pastel-friendly color palette
 colors = ['#FF9999', '#99CCFF', '#99FF99', '#FFCC99', '#CC99FF', '#FFFF99', '#66CCCC', '#FFB6C1', '#C0C0C0', '#CCE5FF', '#FFDAB9', '#E6E6FA']
 
-# Container to store cluster assignments
-all_clusters_df = pd.DataFrame()
-
-# Store values
-inertias = []
-silhouette_scores = []
-K = range(4, 13)
-
-for k in K:
-    df = df_original.copy()
-
-    # Run KMeans
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init=12)
-    df["cluster"] = kmeans.fit_predict(df[["latitude", "longitude"]])
-    centroids = kmeans.cluster_centers_
-
-    # Save inertia
-    inertias.append(kmeans.inertia_)
-
-    # Compute silhouette score (only if k > 1)
-    score = silhouette_score(df[["latitude", "longitude"]], df["cluster"])
-    silhouette_scores.append(score)
-
-    # Append to combined CSV export
-    df_k = df[["station_name", "latitude", "longitude", "cluster"]].copy()
-    df_k["k"] = k
-    all_clusters_df = pd.concat([all_clusters_df, df_k], ignore_index=True)
-
-    # Create folium map
-    m = folium.Map(location=[43.65, -79.38], zoom_start=12, tiles="CartoDB positron")
-
-    # Plot station markers
-    for _, row in df.iterrows():
-        folium.CircleMarker(
-            location=[row["latitude"], row["longitude"]],
-            radius=4,
-            color=colors[row["cluster"] % len(colors)],
-            fill=True,
-            fill_opacity=0.8,
-            weight=1,
-            popup=f"<b>Station:</b> {row['station_name']}<br><b>Cluster:</b> {row['cluster']}"
-        ).add_to(m)
-
-    # Plot centroid markers and radius
-    for i, (lat, lon) in enumerate(centroids):
-        # Center marker
-        folium.Marker(
-            location=[lat, lon],
-            popup=f"Centroid {i}"
-        ).add_to(m)
-
-    legend_html = f"""
-<div style="
-    position: fixed; 
-    bottom: 30px; left: 30px; width: 180px; 
+def stations_feature_collection(stations, result):
+    """GeoJSON FeatureCollection string of the stations, with one cluster_k<k> property per k.
+
+    Coordinates appear once no matter how many k values are mapped.
+    """
+    props = stations[["station_name"]].assign(**{f"cluster_k{k}": result.labels[k] for k in result.ks})
+    return feature_collection(stations["latitude"], stations["longitude"], props)
+
+# Draws every k from the single embedded FeatureCollection; k layers are
+# radio-selectable and the legend follows the selected layer
+CLUSTER_LAYERS_TEMPLATE = """
+{% macro html(this, kwargs) %}
+<div id="cluster-legend" style="
+    position: fixed;
+    bottom: 30px; left: 30px; width: 180px;
     background-color: white;
     border: 2px solid grey;
     z-index:9999;
     font-size: 12px;
     padding: 10px;
-    border-radius: 8px;">
-    <strong>Cluster Legend (k={k})</strong><br>
-    {''.join([f"<span style='color:{colors[i % len(colors)]}'>■</span> Cluster {i}<br>" for i in range(k)])}
-</div>
+    border-radius: 8px;"></div>
+{% endmacro %}
+{% macro script(this, kwargs) %}
+(function() {
+    var map = {{ this._parent.get_name() }};
+    var stations = {{ this.geojson }};
+    var centroids = {{ this.centroids }};
+    var colors = {{ this.colors }};
+    var layers = {};
+    var first = null;
+    Object.keys(centroids).forEach(function(k) {
+        var prop = "cluster_k" + k;
+        var group = L.featureGroup();
+        L.geoJSON(stations, {
+            pointToLayer: function(feature, latlng) {
+                var c = feature.properties[prop];
+                return L.circleMarker(latlng, {
+                    radius: 4, color: colors[c % colors.length], fill: true, fillOpacity: 0.8, weight: 1
+                }).bindPopup("<b>Station:</b> " + feature.properties.station_name + "<br><b>Cluster:</b> " + c);
+            }
+        }).addTo(group);
+        centroids[k].forEach(function(center, i) {
+            L.marker(center).bindPopup("Centroid " + i).addTo(group);
+        });
+        group.k = Number(k);
+        layers["k = " + k] = group;
+        if (first === null) { first = group; }
+    });
+    function showLegend(k) {
+        var html = "<strong>Cluster Legend (k=" + k + ")</strong><br>";
+        for (var i = 0; i < k; i++) {
+            html += "<span style='color:" + colors[i % colors.length] + "'>■</span> Cluster " + i + "<br>";
+        }
+        document.getElementById("cluster-legend").innerHTML = html;
+    }
+    first.addTo(map);
+    showLegend(first.k);
+    map.on("baselayerchange", function(e) { showLegend(e.layer.k); });
+    L.control.layers(layers, null, {collapsed: false}).addTo(map);
+})();
+{% endmacro %}
 """
+
+def build_cluster_map(stations, result):
+    m = base_map()
     macro = MacroElement()
-    macro._template = Template(legend_html)
-    m.get_root().add_child(macro)
-
-    # Save the map
-    m.save(os.path.join(save_folder, f"clusters_k{k}_styled.html"))
-    print(f"Saved: visuals/cluster/clusters_k{k}_styled.html")
-
-# Export all assignments
-os.makedirs("data/cluster", exist_ok=True)
-all_clusters_df.to_csv("data/cluster/station_clusters_all_k.csv", index=False)
-print("Cluster assignments saved: data/cluster/station_clusters_all_k.csv")
-
-# Plotting Inertias values
-plt.plot(K, inertias, 'o-', color='orange')
-plt.xlabel('Number of Clusters (k)')
-plt.ylabel('Inertias')
-plt.title('The Elbow Method using Inertias')
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "elbow_method_using_inertias.png"))
-plt.clf()
-
-# Plotting Silhouette Score Plot
-plt.plot(K, silhouette_scores, 'o-', color='green')
-plt.xlabel('Number of Clusters (k)')
-plt.ylabel('Silhouette Score')
-plt.title('Silhouette Score vs K')
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "silhouette_score.png"))
-plt.clf()
-
-print("Cluster plots are saved to visuals folder")
\ No newline at end of file
+    macro._template = Template(CLUSTER_LAYERS_TEMPLATE)
+    macro.geojson = stations_feature_collection(stations, result)
+    macro.centroids = json.dumps({str(k): result.centroids[k].round(6).tolist() for k in result.ks})
+    macro.colors = json.dumps(colors)
+    m.add_child(macro)
+    return m
+
+def run(stations=None, workers=None):
+    # Load data
+    if stations is None:
+        stations = pd.read_csv(STATIONS_PATH)
+    os.makedirs(save_folder, exist_ok=True)
+
+    # Setup for prettier plot
+    sns.set(style="whitegrid")
+    plt.rcParams["figure.figsize"] = (10, 6)
+
+    # Fit every k in parallel and score them against one distance matrix
+    with profiling.step("kmeans", rows=len(stations)):
+        result = sweep_k(stations[["latitude", "longitude"]], K, workers=workers)
+
+    # Combined assignments, one block of rows per k
+    all_clusters_df = pd.concat([
+        stations[["station_name", "latitude", "longitude"]].assign(cluster=result.labels[k], k=k)
+        for k in K
+    ], ignore_index=True)
+
+    # One map with a toggleable layer per k
+    with profiling.step("folium"):
+        m = build_cluster_map(stations, result)
+        m.save(os.path.join(save_folder, "clusters_all_k.html"))
+    print("Saved: visuals/cluster/clusters_all_k.html")
+
+    # Export all assignments
+    os.makedirs("data/cluster", exist_ok=True)
+    all_clusters_df.to_csv("data/cluster/station_clusters_all_k.csv", index=False)
+    print("Cluster assignments saved: data/cluster/station_clusters_all_k.csv")
+
+    # Plotting Inertias values
+    plt.plot(K, result.inertias, 'o-', color='orange')
+    plt.xlabel('Number of Clusters (k)')
+    plt.ylabel('Inertias')
+    plt.title('The Elbow Method using Inertias')
+    plt.tight_layout()
+    plt.savefig(os.path.join(save_folder, "elbow_method_using_inertias.png"))
+    plt.clf()
+
+    # Plotting Silhouette Score Plot
+    plt.plot(K, result.silhouette_scores, 'o-', color='green')
+    plt.xlabel('Number of Clusters (k)')
+    plt.ylabel('Silhouette Score')
+    plt.title('Silhouette Score vs K')
+    plt.tight_layout()
+    plt.savefig(os.path.join(save_folder, "silhouette_score.png"))
+    plt.clf()
+
+    print("Cluster plots are saved to visuals folder")
+    return result
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Cluster stations by location with KMeans and map the clusters.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for the sweep over k (default: one per CPU)")
+    args = parser.parse_args(argv)
+    run(workers=args.workers)
+
+if __name__ == "__main__":
+    main()
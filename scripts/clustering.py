@@ -0,0 +1,87 @@
+import numpy as np
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances, silhouette_score
+from threadpoolctl import threadpool_limits
+
+# Above this many points the exact silhouette (O(n²) memory) is replaced by a sampled one
+EXACT_SILHOUETTE_MAX = 5_000
+SILHOUETTE_SAMPLE_SIZE = 5_000
+
+@dataclass
+class SweepResult:
+    """Outcome of a k sweep; lists are aligned with `ks`."""
+    ks: list
+    inertias: list = field(default_factory=list)
+    silhouette_scores: list = field(default_factory=list)
+    labels: dict = field(default_factory=dict)      # k -> cluster id per point
+    centroids: dict = field(default_factory=dict)   # k -> (k, 2) array
+
+    def best_k(self):
+        return self.ks[int(np.argmax(self.silhouette_scores))]
+
+def _make_model(k, minibatch, random_state, n_init, init="k-means++"):
+    if minibatch:
+        return MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=n_init, init=init, batch_size=1024)
+    return KMeans(n_clusters=k, random_state=random_state, n_init=n_init, init=init)
+
+def _fit_k(coords, k, minibatch, random_state, n_init):
+    # One BLAS/OpenMP thread per process; the sweep's parallelism is across k
+    with threadpool_limits(1):
+        model = _make_model(k, minibatch, random_state, n_init).fit(coords)
+    return model.labels_, model.inertia_, model.cluster_centers_
+
+def _warm_fits(coords, ks, minibatch, random_state, n_init):
+    """Fit ks in increasing order, seeding each k with the previous centroids plus the farthest point."""
+    fits = []
+    centers = None
+    for k in ks:
+        if centers is None or len(centers) >= k:
+            model = _make_model(k, minibatch, random_state, n_init)
+        else:
+            dist = pairwise_distances(coords, centers).min(axis=1)
+            extra = coords[np.argsort(dist)[::-1][:k - len(centers)]]
+            model = _make_model(k, minibatch, random_state, 1, init=np.vstack([centers, extra]))
+        model.fit(coords)
+        centers = model.cluster_centers_
+        fits.append((model.labels_, model.inertia_, centers))
+    return fits
+
+def sweep_k(coords, ks=range(4, 13), workers=None, n_init=12, random_state=42,
+            minibatch=False, warm_start=False, silhouette_sample=None):
+    """Fit KMeans for every k and score each fit.
+
+    Fits run in parallel across processes (or sequentially with warm starts,
+    each k seeded from k-1). Silhouette scores reuse a single precomputed
+    pairwise-distance matrix; for large point sets, or when
+    `silhouette_sample` is given, a sampled silhouette is used instead.
+    minibatch=True switches to MiniBatchKMeans for multi-city or dock-level sets.
+    """
+    coords = np.asarray(coords, dtype="float64")
+    ks = list(ks)
+
+    if warm_start:
+        fits = _warm_fits(coords, ks, minibatch, random_state, n_init)
+    elif workers == 1:
+        fits = [_fit_k(coords, k, minibatch, random_state, n_init) for k in ks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_fit_k, coords, k, minibatch, random_state, n_init) for k in ks]
+            fits = [future.result() for future in futures]
+
+    if silhouette_sample is None and len(coords) > EXACT_SILHOUETTE_MAX:
+        silhouette_sample = SILHOUETTE_SAMPLE_SIZE
+    distances = pairwise_distances(coords) if silhouette_sample is None else None
+
+    result = SweepResult(ks=ks)
+    for k, (labels, inertia, centers) in zip(ks, fits):
+        if distances is not None:
+            score = silhouette_score(distances, labels, metric="precomputed")
+        else:
+            score = silhouette_score(coords, labels, sample_size=silhouette_sample, random_state=random_state)
+        result.inertias.append(inertia)
+        result.silhouette_scores.append(score)
+        result.labels[k] = labels
+        result.centroids[k] = centers
+    return result
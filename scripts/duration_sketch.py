@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from trip_store import add_time_features
+
+# Log-bucketed quantile sketch (DDSketch style): a duration of x seconds is
+# counted in bucket ceil(log_gamma(x)), so any quantile read back from the
+# buckets is within RELATIVE_ACCURACY of the true value. Bucket counts add up,
+# which makes sketches from different months mergeable with a plain sum.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = np.log(GAMMA)
+
+DIMENSIONS = ["user_type", "day_of_week", "hour"]
+CATEGORY_DIMENSIONS = ["user_type", "day_of_week"]
+
+def bucket_keys(seconds):
+    """Sketch bucket of every duration (durations under a second share bucket 0)."""
+    seconds = np.maximum(np.asarray(seconds, dtype="float64"), 1)
+    return np.ceil(np.log(seconds) / LOG_GAMMA).astype("int16")
+
+def bucket_values(keys):
+    """Representative duration (seconds) of each bucket, within RELATIVE_ACCURACY of its members."""
+    return 2 * GAMMA ** np.asarray(keys, dtype="float64") / (GAMMA + 1)
+
+def sketch_trips(df):
+    """Sketch of trip_duration per user_type x day_of_week x hour, in one pass over the trips."""
+    df = add_time_features(df)
+    sketch = (
+        pd.DataFrame({
+            "user_type": df["user_type"],
+            "day_of_week": df["day_of_week"],
+            "hour": df["hour"],
+            "key": bucket_keys(df["trip_duration"]),
+        })
+        .groupby(DIMENSIONS + ["key"], observed=True)
+        .size()
+        .rename("count")
+        .reset_index()
+    )
+    return _compact(sketch)
+
+def merge_sketches(sketches):
+    """Sum bucket counts of partial sketches, e.g. one per month."""
+    combined = pd.concat(sketches, ignore_index=True)
+    return _compact(combined.groupby(DIMENSIONS + ["key"], observed=True, as_index=False)["count"].sum())
+
+def _compact(sketch):
+    for col in CATEGORY_DIMENSIONS:
+        sketch[col] = sketch[col].astype("category")
+    sketch["hour"] = sketch["hour"].astype("uint8")
+    sketch["key"] = sketch["key"].astype("int16")
+    sketch["count"] = sketch["count"].astype("int64")
+    return sketch
+
+def _buckets(sketch, upper=None):
+    """Bucket keys and counts of a (filtered) sketch, summed over every dimension."""
+    if upper is not None:
+        sketch = sketch[sketch["key"] <= bucket_keys(upper)]
+    counts = sketch.groupby("key")["count"].sum().sort_index()
+    return counts.index.to_numpy(), counts.to_numpy()
+
+def _quantile(keys, counts, q):
+    cumulative = np.cumsum(counts)
+    rank = q * (cumulative[-1] - 1)
+    return bucket_values(keys[np.searchsorted(cumulative, rank, side="right")])
+
+def _groups(sketch, by):
+    if not by:
+        return [((), sketch)]
+    return [(group if isinstance(group, tuple) else (group,), rows)
+            for group, rows in sketch.groupby(by, observed=True)]
+
+def quantiles(sketch, qs=(0.5, 0.95, 0.99), by=(), upper=None):
+    """Duration quantiles (seconds) per group of `by`, one p<q> column per quantile."""
+    by = list(by)
+    rows = []
+    for group, rows_in_group in _groups(sketch, by):
+        keys, counts = _buckets(rows_in_group, upper)
+        if not len(keys):
+            continue
+        row = dict(zip(by, group), trips=int(counts.sum()))
+        row.update({f"p{round(q * 100):g}": _quantile(keys, counts, q) for q in qs})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def means(sketch, by, upper=None):
+    """Trips and mean duration (seconds) per group of `by`, from the bucket values
+    (so within RELATIVE_ACCURACY of the exact mean)."""
+    by = list(by)
+    if upper is not None:
+        sketch = sketch[sketch["key"] <= bucket_keys(upper)]
+    weighted = sketch.assign(total=bucket_values(sketch["key"]) * sketch["count"])
+    table = weighted.groupby(by, observed=True, as_index=False)[["count", "total"]].sum()
+    table["mean"] = table["total"] / table["count"]
+    return table.rename(columns={"count": "trips"}).drop(columns="total")
+
+def outlier_cutoff(sketch, q=0.99):
+    """Duration (seconds) above which trips are treated as outliers: the q-quantile of all trips."""
+    keys, counts = _buckets(sketch)
+    return float(_quantile(keys, counts, q))
+
+def box_stats(sketch, by, upper=None, scale=1, order=None):
+    """Boxplot statistics per group for Axes.bxp, read from the sketch buckets.
+
+    Whiskers follow matplotlib's 1.5 IQR rule; fliers are the bucket values
+    beyond the whiskers (one per bucket, not one per trip). `scale` converts
+    the seconds, e.g. 1/60 for minutes.
+    """
+    stats = {}
+    for group, rows in _groups(sketch, [by]):
+        keys, counts = _buckets(rows, upper)
+        if not len(keys):
+            continue
+        values = bucket_values(keys) * scale
+        q1, med, q3 = (_quantile(keys, counts, q) * scale for q in (0.25, 0.5, 0.75))
+        iqr = q3 - q1
+        inside = (values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)
+        stats[str(group[0])] = {
+            "label": str(group[0]),
+            "mean": float(np.dot(values, counts) / counts.sum()),
+            "med": med, "q1": q1, "q3": q3,
+            "whislo": values[inside].min(), "whishi": values[inside].max(),
+            "fliers": values[~inside],
+        }
+    return [stats[label] for label in (order or stats) if label in stats]
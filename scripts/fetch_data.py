@@ -1,29 +1,90 @@
 import requests
 import zipfile
+import hashlib
+import argparse
 import os
 
+CKAN_API_URL = "https://ckan0.cf.opendata.inter.prod-toronto.ca/api/3/action"
+CHUNK_SIZE = 1024 * 1024
+# CKAN resource id of each year's ridership archive; other years need --resource-id
+RESOURCE_IDS = {
+    2023: "f0fa6a67-4571-4dd6-9d5a-df010ebed7d1",
+}
 
-def get_download_url(resource_id):
-    """Fetch the actual file download URL from CKAN metadata"""
-    api_url = f"https://ckan0.cf.opendata.inter.prod-toronto.ca/api/3/action/resource_show?id={resource_id}"
-    response = requests.get(api_url)
+
+def get_resource(resource_id, api_url=CKAN_API_URL):
+    """Fetch the CKAN metadata of a resource (download url, size, ...)"""
+    response = requests.get(f"{api_url}/resource_show", params={"id": resource_id})
     response.raise_for_status()
-    data = response.json()
-    return data['result']['url']
+    return response.json()['result']
+
+
+def get_download_url(resource_id, api_url=CKAN_API_URL):
+    """Fetch the actual file download URL from CKAN metadata"""
+    return get_resource(resource_id, api_url)['url']
+
+
+def sha256sum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 
-def download_zip_file(resource_id, output_path="data/raw/bikeshare_2023.zip"):
+def download_zip_file(resource_id, output_path="data/raw/bikeshare_2023.zip", api_url=CKAN_API_URL, sha256=None):
+    """Stream the archive to disk in chunks, resuming a previous partial download.
+
+    Data goes to `output_path + ".part"` first. If that file exists, only the
+    missing bytes are requested with an HTTP Range header. The file is moved
+    into place once its size (and optional sha256) check out; a partial file
+    of the wrong size is removed and the download restarted once.
+    """
     print("Fetching actual download URL...")
-    download_url = get_download_url(resource_id)
+    resource = get_resource(resource_id, api_url)
+    download_url = resource['url']
     print(f"Downloading from: {download_url}")
 
-    response = requests.get(download_url)
-    if response.status_code != 200:
-        raise Exception(f"Failed to download file: {response.status_code}")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    part_path = output_path + ".part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with requests.get(download_url, headers=headers, stream=True) as response:
+        if response.status_code == 416:
+            # Range starts at the end of the file: the partial download is complete
+            expected_size = offset
+        elif response.status_code in (200, 206):
+            if response.status_code == 200 and offset:
+                print("Server ignored the Range request, restarting download")
+                offset = 0
+            if offset:
+                print(f"Resuming download at byte {offset:,}")
+            content_length = response.headers.get("Content-Length")
+            expected_size = offset + int(content_length) if content_length else None
 
-    with open(output_path, "wb") as f:
-        f.write(response.content)
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+        else:
+            raise Exception(f"Failed to download file: {response.status_code}")
 
+    size = os.path.getsize(part_path)
+    if resource.get("size"):
+        expected_size = int(resource["size"])
+    if expected_size is not None and size != expected_size:
+        # The stream finished (or there was nothing left to resume), so the
+        # partial file is wrong rather than incomplete: start over
+        os.remove(part_path)
+        if offset:
+            print(f"Partial download has {size:,} bytes, expected {expected_size:,}; restarting download")
+            return download_zip_file(resource_id, output_path, api_url, sha256)
+        raise Exception(f"Downloaded {size:,} bytes, expected {expected_size:,}; removed the partial download")
+    if sha256 and sha256sum(part_path) != sha256.lower():
+        os.remove(part_path)
+        raise Exception("Checksum mismatch, removed the partial download")
+
+    os.replace(part_path, output_path)
     print(f"File downloaded to {output_path}")
 
 def extract_zip(zip_path, extract_to="data/raw/"):
@@ -31,13 +92,30 @@ def extract_zip(zip_path, extract_to="data/raw/"):
         zip_ref.extractall(extract_to)
     print(f"Extracted files to {extract_to}")
 
-if __name__ == "__main__":
-    resource_id = "f0fa6a67-4571-4dd6-9d5a-df010ebed7d1"
-    zip_path = "data/raw/bikeshare_2023.zip"
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Download the Bike Share Toronto ridership archive.")
+    parser.add_argument("--api-url", default=CKAN_API_URL, help="CKAN action API base URL")
+    parser.add_argument("--sha256", default=None, help="Expected sha256 of the archive")
+    parser.add_argument("--year", type=int, default=2023, help="Ridership year the resource holds")
+    parser.add_argument("--resource-id", default=None,
+                        help=f"CKAN resource id of that year's archive (known for {', '.join(map(str, RESOURCE_IDS))})")
+    parser.add_argument("--extract", action="store_true",
+                        help="Also extract the CSVs (clean_data.py can read them straight from the zip)")
+    args = parser.parse_args(argv)
+    resource_id = args.resource_id or RESOURCE_IDS.get(args.year)
+    if resource_id is None:
+        parser.error(f"--resource-id is required for --year {args.year}")
+
+    # clean_data.py picks up every data/raw/bikeshare_<year>.zip
+    zip_path = f"data/raw/bikeshare_{args.year}.zip"
 
     if not os.path.exists(zip_path):
-        download_zip_file(resource_id, zip_path)
+        download_zip_file(resource_id, zip_path, api_url=args.api_url, sha256=args.sha256)
     else:
         print("ZIP file already exists, skipping download.")
 
-    extract_zip(zip_path)
+    if args.extract:
+        extract_zip(zip_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial, reduce
+import pandas as pd
+import profiling
+from trip_store import TRIPS_PATH, add_time_features, list_partitions
+
+# An aggregation over the trip store, expressed as map-reduce: `map` turns the
+# trips of one monthly partition (only `columns` are read) into a small partial
+# result, and `reduce` merges the partials of every partition, always in
+# partition order, into the final result. Both must be module-level functions
+# (or partials of them) so they can be sent to worker processes.
+Aggregation = namedtuple("Aggregation", ["columns", "map", "reduce"])
+
+def fork_context():
+    """The fork start method where available: workers reuse the already imported
+    modules and share the parent's loaded data copy-on-write. None elsewhere (the default)."""
+    return multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+
+def map_partitions(func, items, workers=None):
+    """func(item) for every item (e.g. partition path) in a process pool; results keep the item order."""
+    items = list(items)
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=fork_context()) as pool:
+        return list(pool.map(func, items))
+
+def read_partition(path, columns):
+    """One partition's trips, with the day / month codes labeled like load_trips + add_time_features."""
+    return add_time_features(pd.read_parquet(path, columns=columns))
+
+def _map_partition(aggregation, path):
+    return aggregation.map(read_partition(path, aggregation.columns))
+
+def map_reduce(aggregation, store_path=TRIPS_PATH, workers=None, paths=None):
+    """Run an aggregation over the trip store (or the given partition files), one partition per task."""
+    paths = list(list_partitions(store_path).values()) if paths is None else list(paths)
+    with profiling.step("map_reduce"):
+        partials = map_partitions(partial(_map_partition, aggregation), paths, workers)
+        return aggregation.reduce(partials)
+
+def _add(a, b):
+    if isinstance(a, dict):
+        return {**a, **{key: a[key] + value if key in a else value for key, value in b.items()}}
+    if isinstance(a, tuple):
+        return tuple(_add(x, y) for x, y in zip(a, b))
+    return a + b
+
+def sum_partials(partials):
+    """Reduce for additive partials: equally shaped arrays or sparse matrices, or tuples / dicts of them."""
+    return reduce(_add, partials)
@@ -0,0 +1,187 @@
+import os
+import json
+import argparse
+from collections import namedtuple
+from functools import partial
+import numpy as np
+import pandas as pd
+import artifact_cache
+from trip_store import PROCESSED_DATA_PATH, TRIPS_PATH, list_partitions, partition_month
+from station_dictionary import load_dictionary
+from mapreduce import map_partitions
+
+FLOW_DIR = os.path.join(PROCESSED_DATA_PATH, "net_flow")
+BUCKET_MINUTES = 60
+BUCKET_CHOICES = [15, 30, 60]
+# Net trips per station and bucket stay far below 32k, so two bytes per cell
+FLOW_DTYPE = "int16"
+
+# Trip columns needed to fill the array
+COLUMNS = ["start_station_code", "end_station_code", "start_time", "end_time"]
+
+# Net flow (trips started - trips ended) per time bucket x station code, as a
+# read-only memory-mapped array: rows are consecutive buckets from `origin`
+# (a midnight), so date ranges are contiguous row slices.
+NetFlow = namedtuple("NetFlow", ["flow", "origin", "bucket_minutes"])
+
+def _paths(bucket_minutes, path):
+    base = os.path.join(path, f"net_flow_{bucket_minutes}min")
+    return base + ".npy", base + ".json"
+
+def buckets_per_day(bucket_minutes):
+    return 24 * 60 // bucket_minutes
+
+def bucket_index(times, origin, bucket_minutes):
+    """Bucket row of every timestamp (NaT maps to -1)."""
+    times = pd.DatetimeIndex(times).as_unit("ns")
+    offsets = (times.asi8 - pd.Timestamp(origin).as_unit("ns").value) // (bucket_minutes * 60 * 10**9)
+    return np.where(times.isna(), -1, offsets)
+
+def flow_range(store_path=TRIPS_PATH):
+    """Origin (midnight of the first partition month) and day count covering every partition, plus
+    one day for trips ending after their month."""
+    months = sorted(partition_month(file_path) for file_path in list_partitions(store_path).values())
+    origin = pd.Timestamp(*months[0], 1)
+    end = pd.Timestamp(*months[-1], 1) + pd.offsets.MonthBegin(1) + pd.Timedelta(days=1)
+    return origin, (end - origin).days
+
+def _partition_flow(origin, bucket_minutes, n_buckets, n_stations, path):
+    """Net flow of one partition over the buckets it touches: (first bucket, int32 array)."""
+    df = pd.read_parquet(path, columns=COLUMNS)
+    sides = []
+    for codes, times in ((df["start_station_code"], df["start_time"]), (df["end_station_code"], df["end_time"])):
+        codes = codes.to_numpy("int64")
+        rows = bucket_index(times, origin, bucket_minutes)
+        valid = (codes >= 0) & (rows >= 0) & (rows < n_buckets)
+        sides.append((rows[valid], codes[valid]))
+    all_rows = np.concatenate([rows for rows, _ in sides])
+    if not len(all_rows):
+        return 0, np.zeros((0, n_stations), dtype="int32")
+    first, last = all_rows.min(), all_rows.max() + 1
+    size = (last - first) * n_stations
+    starts, ends = (np.bincount((rows - first) * n_stations + codes, minlength=size) for rows, codes in sides)
+    return int(first), (starts - ends).astype("int32").reshape(last - first, n_stations)
+
+def build_net_flow(store_path=TRIPS_PATH, path=FLOW_DIR, bucket_minutes=BUCKET_MINUTES, workers=None):
+    """Fill the bucket x station net flow array from the trip store, one partition per task.
+
+    The array is written as a memory-mapped .npy file, so multi-year
+    histories never have to fit in memory; partitions add into the rows
+    they touch (trips ending in the next month included).
+    """
+    if not list_partitions(store_path):
+        raise FileNotFoundError(f"No trip partitions under {store_path}")
+    origin, days = flow_range(store_path)
+    n_buckets = days * buckets_per_day(bucket_minutes)
+    n_stations = len(load_dictionary())
+
+    os.makedirs(path, exist_ok=True)
+    array_path, meta_path = _paths(bucket_minutes, path)
+    tmp_path = array_path + ".tmp.npy"
+    flow = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=FLOW_DTYPE, shape=(n_buckets, n_stations))
+    limits = np.iinfo(FLOW_DTYPE)
+    partition_flow = partial(_partition_flow, origin, bucket_minutes, n_buckets, n_stations)
+    for first, net in map_partitions(partition_flow, list_partitions(store_path).values(), workers):
+        window = flow[first:first + len(net)].astype("int32") + net
+        if window.size and (window.min() < limits.min or window.max() > limits.max):
+            raise OverflowError(f"Net flow exceeds {FLOW_DTYPE}; use a smaller bucket")
+        flow[first:first + len(net)] = window
+    flow.flush()
+    del flow
+    os.replace(tmp_path, array_path)
+    with open(meta_path, "w") as f:
+        json.dump({"origin": origin.isoformat(), "bucket_minutes": bucket_minutes,
+                   "buckets": n_buckets, "stations": n_stations,
+                   "trip_store": artifact_cache.path_digest(store_path)}, f, indent=2)
+    print(f"Net flow saved: {array_path} ({n_buckets:,} buckets x {n_stations} stations)")
+    return load_net_flow(bucket_minutes, path)
+
+def _load_meta(bucket_minutes=BUCKET_MINUTES, path=FLOW_DIR):
+    _, meta_path = _paths(bucket_minutes, path)
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+def is_current(bucket_minutes=BUCKET_MINUTES, store_path=TRIPS_PATH, path=FLOW_DIR):
+    """True if the array for a bucket size was built from the trip store as it is now,
+    and still covers its date range and every station code in the dictionary."""
+    meta = _load_meta(bucket_minutes, path)
+    built_from = meta.get("trip_store")
+    if built_from is None or built_from != artifact_cache.path_digest(store_path) or not list_partitions(store_path):
+        return False
+    origin, days = flow_range(store_path)
+    return (meta["stations"] == len(load_dictionary()) and pd.Timestamp(meta["origin"]) == origin
+            and meta["buckets"] == days * buckets_per_day(bucket_minutes))
+
+def load_net_flow(bucket_minutes=BUCKET_MINUTES, path=FLOW_DIR):
+    """Memory-map the net flow array for a bucket size, (re)building it if it is missing or stale
+    (e.g. the dictionary gained stations since it was built)."""
+    if not is_current(bucket_minutes, path=path):
+        return build_net_flow(path=path, bucket_minutes=bucket_minutes)
+    array_path, _ = _paths(bucket_minutes, path)
+    meta = _load_meta(bucket_minutes, path)
+    return NetFlow(np.load(array_path, mmap_mode="r"), pd.Timestamp(meta["origin"]), meta["bucket_minutes"])
+
+def _rows(net, start=None, end=None, hours=None):
+    """Bucket rows in [start, end), optionally only those starting within hours=(from, to) of the day."""
+    first = 0 if start is None else max(int(bucket_index([start], net.origin, net.bucket_minutes)[0]), 0)
+    last = len(net.flow) if end is None else min(int(bucket_index([end], net.origin, net.bucket_minutes)[0]), len(net.flow))
+    if hours is None:
+        return slice(first, max(first, last))
+    rows = np.arange(first, max(first, last))
+    hour_of_day = (rows % buckets_per_day(net.bucket_minutes)) * net.bucket_minutes / 60
+    return rows[(hour_of_day >= hours[0]) & (hour_of_day < hours[1])]
+
+def window(net, start=None, end=None, hours=None, stations=None):
+    """Net flow in [start, end) as a (bucket, station) array; `hours` keeps only those hours of
+    each day (e.g. (7, 10)), `stations` only those station codes."""
+    flow = net.flow[_rows(net, start, end, hours)]
+    return flow if stations is None else flow[:, np.asarray(stations)]
+
+def bucket_times(net, start=None, end=None, hours=None):
+    """Start time of every bucket window() returns for the same arguments."""
+    rows = _rows(net, start, end, hours)
+    rows = np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows
+    return net.origin + pd.to_timedelta(rows * net.bucket_minutes, unit="min")
+
+def station_series(net, code, start=None, end=None, hours=None):
+    """Net flow of one station per bucket, indexed by bucket start time."""
+    return pd.Series(window(net, start, end, hours, [code])[:, 0], index=bucket_times(net, start, end, hours),
+                     name="net_flow")
+
+def inventory_drift(net, start=None, end=None, stations=None):
+    """Bikes gained (ends - starts) since midnight, as a (day, bucket of the day, station) array.
+
+    start / end are dates (end exclusive).
+    """
+    start = None if start is None else pd.Timestamp(start).normalize()
+    end = None if end is None else pd.Timestamp(end).normalize()
+    flow = window(net, start, end, stations=stations)
+    per_day = buckets_per_day(net.bucket_minutes)
+    days = len(flow) // per_day
+    return -np.cumsum(flow[:days * per_day].reshape(days, per_day, flow.shape[1]), axis=1, dtype="int32")
+
+def rank_stations(net, start=None, end=None, hours=None, n=10, dictionary=None):
+    """Top n exporters (most trips started than ended) and importers over a window, from the array alone."""
+    dictionary = load_dictionary() if dictionary is None else dictionary
+    totals = window(net, start, end, hours).sum(axis=0, dtype="int64")
+    names = dictionary.sort_values("code")["normalized_name"].to_numpy()
+    table = pd.DataFrame({"code": np.arange(len(totals), dtype="int32"), "station_name": names[:len(totals)],
+                          "net_flow": totals})
+    exporters = table.nlargest(n, "net_flow").reset_index(drop=True)
+    importers = table.nsmallest(n, "net_flow").reset_index(drop=True)
+    return exporters, importers
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Build the station x time-bucket net flow array.")
+    parser.add_argument("--bucket-minutes", type=int, default=BUCKET_MINUTES, choices=BUCKET_CHOICES)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    net = build_net_flow(bucket_minutes=args.bucket_minutes, workers=args.workers)
+    exporters, importers = rank_stations(net)
+    print("Top exporters:\n", exporters.to_string(index=False))
+    print("Top importers:\n", importers.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
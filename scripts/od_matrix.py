@@ -0,0 +1,157 @@
+import os
+import json
+import argparse
+from functools import partial
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import artifact_cache
+from trip_store import PROCESSED_DATA_PATH, TRIPS_PATH, add_time_features, list_partitions
+from station_dictionary import load_dictionary
+from mapreduce import Aggregation, map_reduce, sum_partials
+
+OD_DIR = os.path.join(PROCESSED_DATA_PATH, "od_matrix")
+
+# Dimensions the matrix can be sliced by; each slice is its own matrix on disk
+SLICE_DIMENSIONS = ["hour", "day_of_week", "user_type"]
+
+# Trip columns needed to build the matrices
+COLUMNS = ["start_station_code", "end_station_code", "hour", "day_of_week", "user_type"]
+
+def build_od_matrix(start_codes, end_codes, n_stations, n_destinations=None):
+    """Trips between every pair of stations as a CSR matrix (rows: origin, columns: destination).
+
+    Trips with an unknown station (code -1) are left out.
+    """
+    start_codes = np.asarray(start_codes, dtype="int64")
+    end_codes = np.asarray(end_codes, dtype="int64")
+    valid = (start_codes >= 0) & (end_codes >= 0)
+    trips = np.ones(valid.sum(), dtype="int64")
+    shape = (n_stations, n_destinations or n_stations)
+    # Duplicate (origin, destination) entries are summed on conversion
+    return sparse.coo_matrix((trips, (start_codes[valid], end_codes[valid])), shape=shape).tocsr()
+
+def slice_values(df, dimension):
+    """Value of `dimension` for every trip; its labels match the slice file names."""
+    return add_time_features(df[[dimension]])[dimension]
+
+def build_od_slices(df, n_stations, dimensions=SLICE_DIMENSIONS):
+    """The full matrix plus one matrix per value of every slice dimension.
+
+    Each dimension is counted in one pass: its slices are stacked vertically
+    (origin rows offset by slice * n_stations) and split afterwards.
+    """
+    start_codes = df["start_station_code"].to_numpy(dtype="int32")
+    end_codes = df["end_station_code"].to_numpy(dtype="int32")
+    slices = {"all": build_od_matrix(start_codes, end_codes, n_stations)}
+    for dimension in dimensions:
+        values = pd.Categorical(slice_values(df, dimension)).remove_unused_categories()
+        offsets = values.codes.astype("int64") * n_stations
+        rows = np.where(start_codes >= 0, offsets + start_codes, -1)
+        stacked = build_od_matrix(rows, end_codes, n_stations * len(values.categories), n_stations)
+        for i, value in enumerate(values.categories):
+            slices[slice_key(dimension, value)] = stacked[i * n_stations:(i + 1) * n_stations]
+    return slices
+
+def slice_key(dimension, value):
+    return f"{dimension}={value}"
+
+def _slice_file(key):
+    return key.replace("=", "_").replace(" ", "_").lower() + ".npz"
+
+def build_od_store(store_path=TRIPS_PATH, path=OD_DIR, workers=None):
+    """Build every OD matrix from the trip store and save them.
+
+    Counts are additive: each partition's matrices are built in a process
+    pool and summed into the totals.
+    """
+    n_stations = len(load_dictionary())
+    totals = {}
+    if list_partitions(store_path):
+        slices = Aggregation(COLUMNS, partial(build_od_slices, n_stations=n_stations), sum_partials)
+        totals = map_reduce(slices, store_path, workers)
+
+    os.makedirs(path, exist_ok=True)
+    for file in os.listdir(path):
+        os.remove(os.path.join(path, file))
+    slices = {}
+    for key, matrix in totals.items():
+        slices[key] = _slice_file(key)
+        sparse.save_npz(os.path.join(path, slices[key]), matrix)
+    index = {"trip_store": artifact_cache.path_digest(store_path), "slices": slices}
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    print(f"OD matrices saved: {path} ({len(slices)} slices, {totals['all'].nnz if totals else 0:,} routes)")
+    return totals
+
+def _load_index(path=OD_DIR):
+    index_path = os.path.join(path, "index.json")
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
+
+def is_current(store_path=TRIPS_PATH, path=OD_DIR):
+    """True if the saved matrices were built from the trip store as it is now."""
+    built_from = _load_index(path).get("trip_store")
+    return built_from is not None and built_from == artifact_cache.path_digest(store_path)
+
+def load_od(dimension=None, value=None, path=OD_DIR):
+    """Load the full OD matrix, or the slice for one dimension value (e.g. "hour", 8).
+
+    The matrices are (re)built from the trip store first if they are missing
+    or older than it.
+    """
+    if not is_current(path=path):
+        build_od_store(path=path)
+    slices = _load_index(path)["slices"]
+
+    key = "all" if dimension is None else slice_key(dimension, value)
+    if key not in slices:
+        raise KeyError(f"No OD slice for {key}")
+    return sparse.load_npz(os.path.join(path, slices[key])).tocsr()
+
+def top_routes(od, n=10, dictionary=None):
+    """The n busiest (origin, destination) pairs, with station names when a dictionary is given."""
+    coo = od.tocoo()
+    n = min(n, coo.nnz)
+    top = np.argpartition(coo.data, -n)[-n:] if n else np.array([], dtype="int64")
+    routes = pd.DataFrame({
+        "start_station_code": coo.row[top],
+        "end_station_code": coo.col[top],
+        "trips": coo.data[top],
+    }).sort_values("trips", ascending=False, kind="stable").reset_index(drop=True)
+    if dictionary is not None:
+        names = dictionary.set_index("code")["station_name"]
+        routes["start_station_name"] = routes["start_station_code"].map(names)
+        routes["end_station_name"] = routes["end_station_code"].map(names)
+    return routes
+
+def station_totals(od):
+    """Outbound (row sums) and inbound (column sums) trips per station code."""
+    return pd.DataFrame({
+        "code": np.arange(od.shape[0], dtype="int32"),
+        "outbound": np.asarray(od.sum(axis=1)).ravel(),
+        "inbound": np.asarray(od.sum(axis=0)).ravel(),
+    })
+
+def route_flows(od, min_trips=1):
+    """Every route with at least `min_trips` trips, as code pairs for drawing flow lines on maps."""
+    coo = od.tocoo()
+    keep = coo.data >= min_trips
+    return pd.DataFrame({
+        "start_station_code": coo.row[keep],
+        "end_station_code": coo.col[keep],
+        "trips": coo.data[keep],
+    })
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog,
+                                     description="Build the origin-destination matrices from the trip store.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for the per-partition counts (default: one per CPU)")
+    args = parser.parse_args(argv)
+    build_od_store(workers=args.workers)
+
+if __name__ == "__main__":
+    main()
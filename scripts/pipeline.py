@@ -0,0 +1,221 @@
+import os
+import sys
+import time
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")  # Stages render in worker processes without a display
+
+import EDA
+import trip_duration_visuals
+import station_imbalance_analysis
+import cluster_analysis
+import spatial_usage
+import clean_data
+import trip_cube
+import od_matrix
+import net_flow
+import profiling
+import artifact_cache
+from mapreduce import fork_context
+from trip_store import TRIPS_PATH, load_trips, add_time_features, list_partitions
+from station_index import ZONES_PATH
+
+STATIONS_PATH = "data/stations_with_coords_clean.csv"
+REPORT_PATH = "reports/pipeline_report.json"
+# Inputs a stage can run without; still part of its fingerprint
+OPTIONAL_INPUTS = {ZONES_PATH}
+
+# A pipeline stage: the callable to run, the trip columns it reads from the
+# shared frame (empty if it does not use trips), the files it reads/writes and
+# the parameters its outputs depend on. Inputs, params and the stage's code
+# make up the fingerprint used to skip stages whose outputs are up to date.
+Stage = namedtuple("Stage", ["run", "trip_columns", "inputs", "outputs", "params"], defaults=[{}])
+
+STAGES = {
+    "eda": Stage(
+        run=EDA.run,
+        trip_columns=EDA.COLUMNS,
+        inputs=[TRIPS_PATH],
+        outputs=[EDA.save_folder],
+    ),
+    "trip_duration": Stage(
+        run=trip_duration_visuals.run,
+        trip_columns=trip_duration_visuals.COLUMNS,
+        inputs=[TRIPS_PATH],
+        outputs=[trip_duration_visuals.save_folder],
+        params={"outlier_quantile": trip_duration_visuals.OUTLIER_QUANTILE},
+    ),
+    "station_imbalance": Stage(
+        run=station_imbalance_analysis.run,
+        trip_columns=station_imbalance_analysis.COLUMNS,
+        inputs=[TRIPS_PATH],
+        outputs=[station_imbalance_analysis.save_folder],
+    ),
+    "cluster": Stage(
+        run=cluster_analysis.run,
+        trip_columns=[],
+        inputs=[STATIONS_PATH],
+        outputs=[cluster_analysis.save_folder, "data/cluster/station_clusters_all_k.csv"],
+        params={"k": list(cluster_analysis.K)},
+    ),
+    "spatial": Stage(
+        run=spatial_usage.run,
+        trip_columns=spatial_usage.COLUMNS,
+        inputs=[TRIPS_PATH, STATIONS_PATH, ZONES_PATH],
+        outputs=[spatial_usage.save_folder],
+        params={"frames": "hour"},
+    ),
+}
+
+# Stores derived from the trip store: a check that one was built from the
+# trip store as it is now, and the function that rebuilds it
+DERIVED_STORES = {
+    "trip_cube": (trip_cube.is_current, trip_cube.build_cube),
+    "od_matrix": (od_matrix.is_current, od_matrix.build_od_store),
+    "net_flow": (net_flow.is_current, net_flow.build_net_flow),
+}
+
+# Loaded once in the parent; forked workers inherit it instead of reloading
+_trips = None
+
+def load_shared_trips(stage_names):
+    """Load the union of the columns the selected stages need, enriched once."""
+    columns = sorted({col for name in stage_names for col in STAGES[name].trip_columns})
+    if not columns:
+        return None
+    return add_time_features(load_trips(columns=columns))
+
+def refresh_derived_stores():
+    """Rebuild the derived stores that are older than the trip store (e.g. after
+    `bikeshare clean`), here rather than in every stage that loads them."""
+    stale = [name for name, (is_current, _) in DERIVED_STORES.items() if not is_current()]
+    for name in stale:
+        DERIVED_STORES[name][1]()
+    return stale
+
+def stage_fingerprint(name):
+    stage = STAGES[name]
+    code = artifact_cache.local_modules(sys.modules[stage.run.__module__])
+    return artifact_cache.fingerprint(stage.inputs, stage.params, code)
+
+def stale_stages(stage_names):
+    """Stages whose inputs, params or code changed since their outputs were written, with their fingerprints."""
+    fingerprints = {name: stage_fingerprint(name) for name in stage_names}
+    return {name: fp for name, fp in fingerprints.items() if not artifact_cache.is_fresh(f"stage/{name}", fp)}
+
+def run_stage(name, fingerprint=None, inner_workers=None):
+    """Run one stage; returns its wall time and the profiling steps it recorded.
+
+    inner_workers sizes the stage's own pools (chart rendering, the k sweep);
+    stages running side by side get 1 so they do not each fork a pool per CPU.
+    With a fingerprint, the stage's outputs are recorded in the artifact
+    cache once it succeeds.
+    """
+    stage = STAGES[name]
+    first = len(profiling.records())
+    with profiling.step(name) as record:
+        if stage.trip_columns:
+            # _trips is None in spawned workers, in which case the stage loads its own columns
+            record["rows"] = None if _trips is None else len(_trips)
+            stage.run(_trips, workers=inner_workers)
+        else:
+            stage.run(workers=inner_workers)
+    if fingerprint is not None:
+        artifact_cache.record(f"stage/{name}", fingerprint, stage.outputs, stage.params)
+    return record["wall_s"], profiling.records()[first:]
+
+def run_stages(stage_names, workers=None, fingerprints=None):
+    """Run independent stages concurrently, one process per stage.
+
+    Run one at a time (workers=1), each stage may use every CPU for its own
+    pools instead.
+    """
+    fingerprints = fingerprints or {}
+    missing = [path for name in stage_names for path in STAGES[name].inputs
+               if not os.path.exists(path) and path not in OPTIONAL_INPUTS]
+    if missing:
+        raise FileNotFoundError(f"Missing stage inputs: {sorted(set(missing))}")
+
+    if workers == 1:
+        return {name: run_stage(name, fingerprints.get(name))[0] for name in stage_names}
+
+    # fork shares the loaded frame with every worker copy-on-write
+    timings = {}
+    with ProcessPoolExecutor(max_workers=workers or len(stage_names), mp_context=fork_context()) as pool:
+        futures = {pool.submit(run_stage, name, fingerprints.get(name), 1): name for name in stage_names}
+        for future in as_completed(futures):
+            name = futures[future]
+            timings[name], steps = future.result()
+            profiling.add_records(steps)
+            print(f"✅ {name} finished in {timings[name]:.1f}s")
+    return timings
+
+def main(argv=None, prog=None):
+    global _trips
+    parser = argparse.ArgumentParser(prog=prog, description="Run the Toronto Bike Share analysis pipeline.")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma-separated analysis stages to run (default: all of {', '.join(STAGES)})")
+    parser.add_argument("--skip-clean", action="store_true",
+                        help="Reuse the existing trip store instead of re-ingesting the raw CSVs")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used for the analysis stages (1 = sequential, default: one per stage)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-ingest every month and regenerate every output, even if up to date")
+    parser.add_argument("--report", default=REPORT_PATH, help="Where to write the JSON run report")
+    parser.add_argument("--profile", default=None,
+                        help="Comma-separated steps to run under cProfile, e.g. cluster or clean")
+    args = parser.parse_args(argv)
+
+    stage_names = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = [name for name in stage_names if name not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(unknown)}")
+
+    if args.profile:
+        profiling.enable_cprofile(args.profile.split(","))
+    if args.force:
+        artifact_cache.disable()
+    pipeline_start = time.perf_counter()
+
+    if not args.skip_clean and not args.force and os.path.exists(trip_cube.MANIFEST_PATH) and list_partitions():
+        # Only months whose raw file is new or changed are re-ingested
+        print("🔄 Folding new or changed months into the trip store...")
+        with profiling.step("clean"):
+            trip_cube.update_cube()
+    elif not args.skip_clean:
+        print("🔄 Cleaning raw data...")
+        with profiling.step("clean") as record:
+            reports = clean_data.ingest_all_csvs(clean_data.default_raw_sources(), TRIPS_PATH)
+            record["rows"] = sum(report["rows_read"] for report in reports.values())
+        clean_data.print_ingest_report(reports)
+    if list_partitions():
+        with profiling.step("aggregate"):
+            refresh_derived_stores()
+
+    fingerprints = stale_stages(stage_names)
+    skipped = [name for name in stage_names if name not in fingerprints]
+    if skipped:
+        print(f"⏭  Up to date, skipped: {', '.join(skipped)}")
+    stage_names = [name for name in stage_names if name in fingerprints]
+
+    print("📥 Loading trip data once for all stages...")
+    with profiling.step("load_trips") as record:
+        _trips = load_shared_trips(stage_names)
+        record["rows"] = None if _trips is None else len(_trips)
+    if _trips is not None:
+        print(f"Loaded {len(_trips):,} trips")
+
+    if stage_names:
+        print(f"🚀 Running stages: {', '.join(stage_names)}")
+        run_stages(stage_names, args.workers, fingerprints)
+
+    print(f"✅ All steps completed in {time.perf_counter() - pipeline_start:.1f}s")
+    profiling.print_summary()
+    profiling.write_report(args.report, stages=stage_names, skipped=skipped, workers=args.workers,
+                           wall_s=round(time.perf_counter() - pipeline_start, 3))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile
+import platform
+import resource
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Steps to run under cProfile, comma-separated (e.g. "cluster" or "cluster/kmeans").
+# An environment variable so stages running in worker processes see it too.
+PROFILE_ENV = "BIKESHARE_PROFILE"
+PROFILE_DIR = "reports/profiles"
+
+# Steps recorded in this process, in completion order
+_records = []
+_stack = []
+
+def peak_rss_mb():
+    """High-water RSS of this process or any finished child process, in MB."""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def _profiled_steps():
+    return {name.strip() for name in os.environ.get(PROFILE_ENV, "").split(",") if name.strip()}
+
+def enable_cprofile(steps):
+    """Run the named steps (in this process and its future workers) under cProfile."""
+    os.environ[PROFILE_ENV] = ",".join(steps)
+
+@contextmanager
+def step(name, rows=None):
+    """Record wall time, CPU time, memory and rows of a named (possibly nested) step.
+
+    Yields the record so the body can fill in `rows` once it knows them.
+    Nested steps are named parent/child. process_peak_mb is the high-water
+    RSS of the whole process (and its finished children) so far when the
+    step ends, not the memory used by the step alone.
+    """
+    _stack.append(name)
+    qualified = "/".join(_stack)
+    record = {"step": qualified, "rows": rows}
+    profiler = None
+    if {name, qualified} & _profiled_steps():
+        profiler = cProfile.Profile()
+        profiler.enable()
+    wall, cpu = time.perf_counter(), _cpu_seconds()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = round(time.perf_counter() - wall, 4)
+        record["cpu_s"] = round(_cpu_seconds() - cpu, 4)
+        record["process_peak_mb"] = round(peak_rss_mb(), 1)
+        record["pid"] = os.getpid()
+        if profiler is not None:
+            profiler.disable()
+            record["profile"] = _dump_profile(profiler, qualified)
+        _stack.pop()
+        _records.append(record)
+
+def _dump_profile(profiler, qualified):
+    """Save the raw profile and the top functions by cumulative time; returns the .prof path."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{qualified.replace('/', '.')}-{os.getpid()}")
+    profiler.dump_stats(base + ".prof")
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+    with open(base + ".txt", "w") as f:
+        f.write(summary.getvalue())
+    print(f"cProfile of {qualified} saved: {base}.prof")
+    return base + ".prof"
+
+def records():
+    return list(_records)
+
+def add_records(new_records):
+    """Merge steps recorded in another process (e.g. a pipeline worker)."""
+    _records.extend(new_records)
+
+def write_report(path, **extra):
+    """Write the recorded steps, plus any extra fields, as a JSON run report."""
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        **extra,
+        "steps": records(),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Run report saved: {path}")
+    return report
+
+def print_summary(steps=None, depth=1):
+    """Table of the recorded steps up to `depth` levels of nesting."""
+    steps = records() if steps is None else steps
+    print(f"{'step':<40}{'wall s':>9}{'cpu s':>9}{'proc peak MB':>14}{'rows':>12}")
+    for record in steps:
+        if record["step"].count("/") < depth:
+            rows = f"{record['rows']:,}" if record.get("rows") is not None else ""
+            print(f"{record['step']:<40}{record['wall_s']:>9.2f}{record['cpu_s']:>9.2f}"
+                  f"{record['process_peak_mb']:>14.1f}{rows:>12}")
@@ -0,0 +1,373 @@
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from functools import lru_cache, partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import artifact_cache
+import profiling
+from trip_store import TRIPS_PATH, DAY_NAMES, MONTH_NAMES, load_trips
+from station_dictionary import load_dictionary, normalize_station_names
+
+# Only reachable from this machine
+HOST = "127.0.0.1"
+PORT = 8765
+# Distinct query results kept; results are small aggregate tables
+CACHE_SIZE = 512
+# How often (at most) a query checks whether the trip store changed
+RELOAD_CHECK_SECONDS = 10
+
+# Trip columns held in memory
+COLUMNS = ["start_time", "trip_duration", "user_type", "start_station_code", "end_station_code",
+           "year", "month", "day_of_week", "hour"]
+QUERIES = ["count", "duration", "top_stations", "top_routes", "net_flow"]
+DIMENSIONS = ["year", "month", "day_of_week", "hour", "user_type", "start_station", "end_station"]
+# Filters every query accepts; list filters keep trips matching any of the values
+# (e.g. month=6,7). `station` / `end_station` filter on the start / end station;
+# for net_flow, `station` picks the stations to report instead.
+FILTERS = ["start", "end", "user_type", "year", "month", "day_of_week", "hour", "station", "end_station"]
+LIST_FILTERS = FILTERS[2:]
+
+# One load of the trip store: its arrays, names and a result cache of its own.
+# reload() swaps in a new snapshot with one assignment, so a query running
+# meanwhile keeps reading (and caching into) the snapshot it started with.
+Snapshot = namedtuple("Snapshot", ["version", "arrays", "rows", "user_types", "station_names", "station_codes",
+                                   "first_year", "cached"])
+
+def _values(value):
+    """Filter values as a list: comma-separated strings and scalars are split / wrapped."""
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    if isinstance(value, (list, tuple, set, np.ndarray, pd.Index, pd.Series)):
+        return [item for part in value for item in _values(part)]
+    return [value]
+
+def _position(value, names, first=0):
+    """Index (plus `first`) of a day / month given by number or by (prefix of) name."""
+    if isinstance(value, str) and not value.isdigit():
+        matches = [i for i, name in enumerate(names) if name.lower().startswith(value.lower())]
+        if len(matches) != 1:
+            raise ValueError(f"Unknown or ambiguous value: {value}")
+        return matches[0] + first
+    return int(value)
+
+class QueryService:
+    """The processed trips loaded once into memory as typed arrays, answering
+    filtered aggregate queries through an LRU result cache.
+
+    Each trip costs about 26 bytes (start time, duration, two station codes,
+    user type and the calendar columns), so ten million trips fit in ~260 MB.
+    """
+
+    def __init__(self, store_path=TRIPS_PATH, cache_size=CACHE_SIZE):
+        self.store_path = store_path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """(Re)load the trip store and dictionary into a new snapshot with an empty result cache."""
+        with self._lock, profiling.step("load_trips") as record:
+            version = artifact_cache.path_digest(self.store_path)
+            trips = load_trips(COLUMNS, self.store_path)
+            dictionary = load_dictionary().sort_values("code")
+            user_types = trips["user_type"].astype("category")
+            arrays = {
+                "start_time": pd.DatetimeIndex(trips["start_time"]).as_unit("ns").asi8,
+                "trip_duration": trips["trip_duration"].to_numpy("int32"),
+                "user_type": user_types.cat.codes.to_numpy("int8"),
+                "start_station": trips["start_station_code"].to_numpy("int32"),
+                "end_station": trips["end_station_code"].to_numpy("int32"),
+                "year": trips["year"].to_numpy("uint16"),
+                "month": trips["month"].to_numpy("uint8"),
+                "day_of_week": trips["day_of_week"].to_numpy("uint8"),
+                "hour": trips["hour"].to_numpy("uint8"),
+            }
+            snapshot = Snapshot(
+                version=version,
+                arrays=arrays,
+                rows=len(trips),
+                user_types=list(user_types.cat.categories),
+                station_names=dictionary["station_name"].to_numpy(dtype=object),
+                station_codes=dict(zip(dictionary["normalized_name"], dictionary["code"].astype(int))),
+                first_year=int(arrays["year"].min()) if len(trips) else 0,
+                cached=None,
+            )
+            self.snapshot = snapshot._replace(
+                cached=lru_cache(maxsize=self.cache_size)(partial(self._compute, snapshot)))
+            self.checked = time.monotonic()
+            record["rows"] = snapshot.rows
+        print(f"Query service loaded {snapshot.rows:,} trips "
+              f"({sum(array.nbytes for array in arrays.values()) / 1e6:.0f} MB)")
+
+    def refresh(self):
+        """Reload if the trip store changed since it was loaded (checked at most every RELOAD_CHECK_SECONDS)."""
+        if time.monotonic() - self.checked < RELOAD_CHECK_SECONDS:
+            return False
+        self.checked = time.monotonic()
+        if artifact_cache.path_digest(self.store_path) == self.snapshot.version:
+            return False
+        self.reload()
+        return True
+
+    def stats(self):
+        snapshot = self.snapshot
+        info = snapshot.cached.cache_info()
+        return {"rows": snapshot.rows, "cache_hits": info.hits, "cache_misses": info.misses,
+                "cache_entries": info.currsize, "cache_size": info.maxsize}
+
+    def _stations(self, snapshot, values):
+        codes = []
+        for value in values:
+            if isinstance(value, (int, np.integer)) or (isinstance(value, str) and value.lstrip("-").isdigit()):
+                if not 0 <= int(value) < len(snapshot.station_names):
+                    raise ValueError(f"Unknown station code: {value} (0 to {len(snapshot.station_names) - 1})")
+                codes.append(int(value))
+            elif normalize_station_names([value])[0] in snapshot.station_codes:
+                codes.append(snapshot.station_codes[normalize_station_names([value])[0]])
+            else:
+                raise ValueError(f"Unknown station: {value}")
+        return codes
+
+    def normalize(self, query, params, snapshot=None):
+        """Canonical, hashable form of a query, so equivalent requests share a cache entry."""
+        snapshot = snapshot or self.snapshot
+        if query not in QUERIES:
+            raise ValueError(f"Unknown query: {query} (one of {', '.join(QUERIES)})")
+        unknown = set(params) - set(FILTERS) - {"by", "n", "side"}
+        if unknown:
+            raise ValueError(f"Unknown parameter(s): {', '.join(sorted(unknown))}")
+        key = []
+        for name in FILTERS:
+            value = params.get(name)
+            if value is None or (name in LIST_FILTERS and not _values(value)):
+                continue
+            if name in ("start", "end"):
+                value = pd.Timestamp(value).isoformat()
+            elif name in ("station", "end_station"):
+                value = tuple(sorted(set(self._stations(snapshot, _values(value)))))
+            elif name == "user_type":
+                value = tuple(sorted(set(str(v) for v in _values(value))))
+            elif name == "month":
+                value = tuple(sorted(set(_position(v, MONTH_NAMES, first=1) for v in _values(value))))
+            elif name == "day_of_week":
+                value = tuple(sorted(set(_position(v, DAY_NAMES) for v in _values(value))))
+            else:
+                value = tuple(sorted(set(int(v) for v in _values(value))))
+            key.append((name, value))
+        by = params.get("by")
+        if by is not None:
+            if query not in ("count", "duration") or by not in DIMENSIONS:
+                raise ValueError(f"by must be one of {', '.join(DIMENSIONS)} (count and duration only)")
+            key.append(("by", by))
+        if query in ("top_stations", "top_routes", "net_flow"):
+            n = int(params["n"]) if params.get("n") is not None else 10
+            if n < 1:
+                raise ValueError(f"n must be at least 1, got {n}")
+            key.append(("n", n))
+        if query == "top_stations":
+            side = params.get("side") or "start"
+            if side not in ("start", "end"):
+                raise ValueError("side must be start or end")
+            key.append(("side", side))
+        return query, tuple(key)
+
+    def query(self, query, **params):
+        """Answer a query (see QUERIES) as a DataFrame, from the cache when it was asked before."""
+        self.refresh()
+        snapshot = self.snapshot
+        return snapshot.cached(*self.normalize(query, params, snapshot)).copy()
+
+    def _mask(self, snapshot, key, skip=()):
+        a = snapshot.arrays
+        mask = np.ones(snapshot.rows, dtype=bool)
+        for name, value in key:
+            if name in skip:
+                continue
+            if name == "start":
+                mask &= a["start_time"] >= pd.Timestamp(value).value
+            elif name == "end":
+                mask &= a["start_time"] < pd.Timestamp(value).value
+            elif name == "user_type":
+                user_types = snapshot.user_types
+                mask &= np.isin(a["user_type"], [user_types.index(v) for v in value if v in user_types])
+            elif name == "station":
+                mask &= np.isin(a["start_station"], value)
+            elif name in FILTERS:
+                mask &= np.isin(a[name], value)
+        return mask
+
+    def _dimension(self, snapshot, by, mask):
+        """Dense group codes of the selected trips for a dimension, with a label per code."""
+        values = snapshot.arrays[by][mask]
+        first_year = snapshot.first_year
+        if by == "year":
+            return values.astype("int64") - first_year, list(range(first_year, first_year + (
+                int(values.max()) - first_year + 1 if len(values) else 0)))
+        if by == "month":
+            return values.astype("int64") - 1, MONTH_NAMES
+        if by == "day_of_week":
+            return values.astype("int64"), DAY_NAMES
+        if by == "hour":
+            return values.astype("int64"), list(range(24))
+        if by == "user_type":
+            return values.astype("int64"), snapshot.user_types
+        return values.astype("int64"), list(snapshot.station_names)
+
+    def _compute(self, snapshot, query, key):
+        params = dict(key)
+        by, n = params.get("by"), params.get("n")
+        if query == "net_flow":
+            return self._net_flow(snapshot, key, params.get("station"), n)
+        mask = self._mask(snapshot, key)
+        if query == "count":
+            if by is None:
+                return pd.DataFrame({"trips": [int(mask.sum())]})
+            codes, labels = self._dimension(snapshot, by, mask)
+            table = pd.DataFrame({by: labels, "trips": np.bincount(codes, minlength=len(labels))[:len(labels)]})
+            return table[table["trips"] > 0].reset_index(drop=True) if by.endswith("station") else table
+        if query == "duration":
+            return self._duration(snapshot, mask, by)
+        if query == "top_stations":
+            codes = snapshot.arrays[f"{params['side']}_station"][mask]
+            counts = np.bincount(codes, minlength=len(snapshot.station_names))
+            top = np.argsort(-counts, kind="stable")[:n]
+            top = top[counts[top] > 0]
+            return pd.DataFrame({"code": top, "station_name": snapshot.station_names[top], "trips": counts[top]})
+        n_stations = len(snapshot.station_names)
+        a = snapshot.arrays
+        routes = a["start_station"][mask].astype("int64") * n_stations + a["end_station"][mask]
+        counts = np.bincount(routes, minlength=n_stations * n_stations)
+        top = np.argpartition(-counts, min(n, len(counts) - 1))[:n] if len(counts) > n else np.arange(len(counts))
+        top = top[np.argsort(-counts[top], kind="stable")]
+        top = top[counts[top] > 0]
+        start, end = np.divmod(top, n_stations)
+        return pd.DataFrame({"start_station": snapshot.station_names[start], "end_station": snapshot.station_names[end],
+                             "trips": counts[top]})
+
+    def _duration(self, snapshot, mask, by):
+        durations = snapshot.arrays["trip_duration"][mask]
+        if by is None:
+            quantiles = np.percentile(durations, [50, 90]) if len(durations) else [np.nan, np.nan]
+            return pd.DataFrame({"trips": [len(durations)], "mean_s": [durations.mean() if len(durations) else np.nan],
+                                 "median_s": [quantiles[0]], "p90_s": [quantiles[1]]})
+        codes, labels = self._dimension(snapshot, by, mask)
+        grouped = pd.Series(durations).groupby(codes)
+        table = pd.DataFrame({"trips": grouped.size(), "mean_s": grouped.mean(),
+                              "median_s": grouped.median(), "p90_s": grouped.quantile(0.9)})
+        table.insert(0, by, np.asarray(labels, dtype=object)[table.index])
+        return table.reset_index(drop=True)
+
+    def _net_flow(self, snapshot, key, stations, n):
+        """Trips started - ended per station among the filtered trips; the top n
+        stations by absolute net flow, or the requested stations."""
+        mask = self._mask(snapshot, key, skip=("station", "end_station"))
+        n_stations = len(snapshot.station_names)
+        starts = np.bincount(snapshot.arrays["start_station"][mask], minlength=n_stations)
+        ends = np.bincount(snapshot.arrays["end_station"][mask], minlength=n_stations)
+        net = starts - ends
+        codes = np.asarray(stations) if stations else np.argsort(-np.abs(net), kind="stable")[:n]
+        table = pd.DataFrame({"code": codes, "station_name": snapshot.station_names[codes], "starts": starts[codes],
+                              "ends": ends[codes], "net_flow": net[codes]})
+        return table.sort_values("net_flow", ascending=False, kind="stable").reset_index(drop=True)
+
+def _records(table):
+    return json.loads(table.to_json(orient="records"))
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        """GET /<query>?filter=value&by=... -> JSON rows; GET /stats; GET /reload."""
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            name = url.path.strip("/")
+            params = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+            started = time.perf_counter()
+            try:
+                if name == "stats":
+                    body = service.stats()
+                elif name == "reload":
+                    service.reload()
+                    body = service.stats()
+                else:
+                    rows = _records(service.query(name, **params))
+                    body = {"query": name, "rows": rows, "ms": round((time.perf_counter() - started) * 1000, 2)}
+            except (ValueError, KeyError) as error:
+                self._send(400, {"error": str(error)})
+                return
+            self._send(200, body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(host=HOST, port=PORT, store_path=TRIPS_PATH, cache_size=CACHE_SIZE):
+    service = QueryService(store_path, cache_size)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Query service listening on http://{host}:{port}/ ({', '.join(QUERIES)}, stats, reload)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def remote_query(query, params, host=HOST, port=PORT):
+    """Ask a running service; None if there is none."""
+    params = {key: ",".join(map(str, value)) if isinstance(value, list) else value
+              for key, value in params.items() if value is not None}
+    url = f"http://{host}:{port}/{query}?{urllib.parse.urlencode(params)}"
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            return pd.DataFrame(json.load(response)["rows"])
+    except urllib.error.HTTPError as error:
+        raise ValueError(json.load(error).get("error", str(error)))
+    except urllib.error.URLError:
+        return None
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Answer aggregate trip queries from an in-memory copy of the trip store.")
+    parser.add_argument("query", choices=["serve"] + QUERIES)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    parser.add_argument("--by", choices=DIMENSIONS)
+    parser.add_argument("--n", type=int)
+    parser.add_argument("--side", choices=["start", "end"])
+    parser.add_argument("--start", help="First start date, e.g. 2024-07-01")
+    parser.add_argument("--end", help="End start date (exclusive)")
+    for name in LIST_FILTERS:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, action="append",
+                            help="Repeat or comma-separate to match any value")
+    args = parser.parse_args(argv)
+
+    if args.query == "serve":
+        serve(port=args.port, cache_size=args.cache_size)
+    else:
+        params = {name: getattr(args, name) for name in FILTERS + ["by", "n", "side"]}
+        try:
+            # Use a running service when there is one, otherwise load the trips here
+            result = remote_query(args.query, params, port=args.port)
+            if result is None:
+                result = QueryService(cache_size=args.cache_size).query(
+                    args.query, **{key: value for key, value in params.items() if value is not None})
+        except ValueError as error:
+            parser.error(str(error))
+        print(result.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import json
+import numpy as np
+import pandas as pd
+import folium
+from branca.colormap import LinearColormap
+from branca.element import MacroElement, Template
+from folium.plugins import HeatMap, HeatMapWithTime
+
+MAP_CENTER = [43.65, -79.38]
+NET_FLOW_COLORS = ["#ff0000", "#800080", "#0000ff"]  # red -> purple -> blue
+
+def base_map():
+    return folium.Map(location=MAP_CENTER, zoom_start=12, tiles="CartoDB positron")
+
+def feature_collection(lat, lon, properties):
+    """GeoJSON FeatureCollection string for points, built with vectorized string operations.
+
+    `properties` is a DataFrame aligned with lat/lon; it is serialized by
+    pandas' JSON writer rather than feature by feature.
+    """
+    properties = properties.reset_index(drop=True)
+    props = pd.Series(properties.to_json(orient="records", lines=True).splitlines())
+    features = (
+        '{"type":"Feature","geometry":{"type":"Point","coordinates":['
+        + pd.Series(np.asarray(lon, dtype="float64")).astype(str) + ","
+        + pd.Series(np.asarray(lat, dtype="float64")).astype(str)
+        + ']},"properties":' + props + "}"
+    )
+    return '{"type":"FeatureCollection","features":[' + ",".join(features) + "]}"
+
+def interpolate_colors(values, vmin, vmax, colors=NET_FLOW_COLORS):
+    """Hex colors for an array of values on a linear colormap, like branca's LinearColormap."""
+    stops = np.linspace(vmin, vmax, len(colors))
+    rgb = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in colors], dtype="float64")
+    values = np.clip(np.asarray(values, dtype="float64"), vmin, vmax)
+    channels = np.column_stack([np.interp(values, stops, rgb[:, i]) for i in range(3)]).round().astype(int)
+    hex_values = (channels[:, 0] << 16) | (channels[:, 1] << 8) | channels[:, 2]
+    return pd.Series(hex_values).map("#{:06x}".format).to_numpy()
+
+# Draws a FeatureCollection of points as circle markers; color, popup and
+# radius come from each feature's properties
+CIRCLE_LAYER_TEMPLATE = """
+{% macro script(this, kwargs) %}
+L.geoJSON({{ this.geojson }}, {
+    pointToLayer: function(feature, latlng) {
+        var p = feature.properties;
+        return L.circleMarker(latlng, {
+            radius: p.radius, color: p.color, fill: true, fillColor: p.color,
+            fillOpacity: {{ this.fill_opacity }}, weight: {{ this.weight }}
+        }).bindPopup(p.popup);
+    }
+}).addTo({{ this._parent.get_name() }});
+{% endmacro %}
+"""
+
+def add_circle_layer(m, lat, lon, colors, popups, radius=7, fill_opacity=0.6, weight=0):
+    macro = MacroElement()
+    macro._template = Template(CIRCLE_LAYER_TEMPLATE)
+    macro.geojson = feature_collection(lat, lon, pd.DataFrame({"color": colors, "popup": popups, "radius": radius}))
+    macro.fill_opacity = json.dumps(fill_opacity)
+    macro.weight = json.dumps(weight)
+    m.add_child(macro)
+    return m
+
+def usage_heatmap(lat, lon, weight):
+    """Heatmap of station activity, built from the coordinate/weight arrays in one pass."""
+    m = base_map()
+    heat_data = np.column_stack([lat, lon, weight]).tolist()
+    HeatMap(heat_data, radius=6, blur=3, max_zoom=14).add_to(m)
+    return m
+
+def net_flow_map(lat, lon, net_flow, names):
+    """Stations colored red (exporters) to blue (importers) by normalized net flow."""
+    m = base_map()
+    net_flow = np.asarray(net_flow, dtype="float64")
+    normalized = net_flow / np.abs(net_flow).max()  # Range: -1 to 1
+    vmin, vmax = normalized.min(), normalized.max()
+
+    popups = "<b>" + pd.Series(np.asarray(names, dtype=object)).str.title() + "</b><br>Net Flow: " + pd.Series(net_flow).round().astype(int).astype(str)
+    add_circle_layer(m, lat, lon, interpolate_colors(normalized, vmin, vmax), popups.to_numpy())
+
+    colormap = LinearColormap(colors=["red", "purple", "blue"], vmin=vmin, vmax=vmax, caption="Net Flow (Export → Import)")
+    colormap.add_to(m)
+    return m
+
+def frame_counts(frame_ids, station_codes, n_frames, n_stations):
+    """Trips per (frame, station) as a dense array, from one bincount over the combined index."""
+    frame_ids = np.asarray(frame_ids, dtype="int64")
+    station_codes = np.asarray(station_codes, dtype="int64")
+    valid = (frame_ids >= 0) & (station_codes >= 0)
+    flat = frame_ids[valid] * n_stations + station_codes[valid]
+    return np.bincount(flat, minlength=n_frames * n_stations).reshape(n_frames, n_stations)
+
+def time_sliced_heatmap(counts, lat, lon, labels):
+    """Animated heatmap with one frame per row of `counts` (frames x stations).
+
+    Weights are scaled by the busiest station-frame so frames are comparable.
+    """
+    m = base_map()
+    weights = counts / max(counts.max(), 1)
+    coords = np.column_stack([lat, lon])
+    data = [
+        np.column_stack([coords[frame > 0], frame[frame > 0]]).tolist()
+        for frame in weights
+    ]
+    HeatMapWithTime(data, index=list(labels), radius=12, auto_play=False, max_opacity=0.8).add_to(m)
+    return m
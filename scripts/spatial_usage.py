@@ -1,113 +1,129 @@
 import pandas as pd
-import folium
 import os
-import seaborn as sns
-import matplotlib.pyplot as plt
-from branca.colormap import LinearColormap
-from folium.plugins import HeatMap
+import argparse
+from functools import partial
+from spatial_maps import usage_heatmap, net_flow_map, frame_counts, time_sliced_heatmap
+from charts import ChartSpec, bin_counts, render
+from density import histogram_curve
+import profiling
+from mapreduce import Aggregation, map_reduce, sum_partials
+from station_dictionary import load_dictionary, station_counts, balance_table
+from station_index import STATIONS_PATH, build_station_index, station_coordinates, station_zones, load_zones
 
 save_folder="visuals/spatial"
-os.makedirs(save_folder, exist_ok=True)
-
-# Load trip data and station location data
-trips = pd.read_csv("data/processed/bikeshare_2023_combined.csv")
-stations = pd.read_csv("data/stations_with_coords_clean.csv")
-
-# Normalize station names
-trips["start_station_name"] = trips["start_station_name"].str.strip().str.lower()
-trips["end_station_name"] = trips["end_station_name"].str.strip().str.lower()
-stations["station_name"] = stations["station_name"].str.strip().str.lower()
-
-# Calculate trip counts
-start_counts = trips["start_station_name"].value_counts()
-end_counts = trips["end_station_name"].value_counts()
-
-# Combine into a balance dataframe
-station_balance = pd.DataFrame({
-    "starts": start_counts,
-    "ends": end_counts
-}).fillna(0)
-
-station_balance["net_flow"] = station_balance["starts"] - station_balance["ends"]
-station_balance["total_activity"] = station_balance["starts"] + station_balance["ends"]
-station_balance = station_balance.reset_index().rename(columns={"index": "station_name"})
-
-# Merge coordinates
-station_balance = station_balance.merge(stations, on="station_name", how="left")
-station_balance = station_balance.dropna(subset=["latitude", "longitude"])
-
-# Create heatmap
-m = folium.Map(location=[43.65, -79.38], zoom_start=12, tiles="CartoDB positron")
-
-# Heatmap uses total activity for intensity
-heat_data = [
-    [row["latitude"], row["longitude"], row["total_activity"]]
-    for _, row in station_balance.iterrows()
-]
-
-HeatMap(heat_data, radius=6, blur=3, max_zoom=14).add_to(m)
-
-# Save
-m.save(os.path.join(save_folder, "station_usage_heatmap.html"))
-print("Heatmap saved: visuals/spatial/station_usage_heatmap.html")
-
-m2 = folium.Map(location=[43.65, -79.38], zoom_start=12, tiles="CartoDB positron")
-
-# Set up diverging colormap centered at 0
-vmax = station_balance["net_flow"].abs().max()
-station_balance["normalized_flow"] = station_balance["net_flow"] / vmax  # Range: -1 to 1
-
-vmin = station_balance["normalized_flow"].min()
-vmax = station_balance["normalized_flow"].max()
-
-colormap = LinearColormap(colors=["red", "purple", "blue"], vmin=vmin, vmax=vmax, caption="Net Flow (Export → Import)")
-
-# Add colored circle markers based on net flow
-for _, row in station_balance.iterrows():
-    folium.CircleMarker(
-        location=[row["latitude"], row["longitude"]],
-        radius=7,
-        color=colormap(row["normalized_flow"]),
-        fill=True,
-        fill_color=colormap(row["normalized_flow"]),
-        fill_opacity=0.6,
-        weight=0,
-        popup=f"<b>{row['station_name'].title()}</b><br>Net Flow: {row['net_flow']:.0f}"
-    ).add_to(m2)
-
-# Add color legend to map
-colormap.add_to(m2)
-
-m2.save(os.path.join(save_folder, "net_flow_map.html"))
-print("Heatmap saved: visuals/net_flow_map.html")
-
-def classify_location_type(name):
-    name = name.lower()
-    if any(kw in name for kw in ["north york", "scarborough", "etobicoke", "eglinton", "kipling", "kennedy", "finch"]):
-        return "Suburban"
-    else:
-        return "Downtown"
-
-station_balance["location_type"] = station_balance["station_name"].apply(classify_location_type)
-summary = station_balance.groupby("location_type")[["starts", "ends", "total_activity"]].sum().reset_index()
-print(summary)
-
-# Plotting
-plt.figure(figsize=(10, 6))
-sns.histplot(
-    station_balance["net_flow"],
-    bins=30,
-    kde=True,
-    color="skyblue",
-    edgecolor="black"
-)
-
-plt.axvline(0, color='red', linestyle='--', linewidth=1.5, label="Net Zero")
-plt.title("Distribution of Net Bike Flow Across Stations")
-plt.xlabel("Net Flow (Starts - Ends)")
-plt.ylabel("Number of Stations")
-plt.legend()
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "net_flow_distribution.png"))
-
-print("Spatial plots are saved to visuals folder")
\ No newline at end of file
+
+# Trip columns this analysis reads from the processed trip store
+COLUMNS = ["start_station_code", "end_station_code", "hour"]
+
+def frame_labels(frames="hour"):
+    if frames == "hour":
+        return [f"{h:02d}:00" for h in range(24)]
+    if frames == "week":
+        return [f"Week {w}" for w in range(1, 54)]
+    raise ValueError(f"Unknown frames: {frames}")
+
+def time_frames(trips, frames="hour"):
+    """Frame index per trip for the animated heatmap, with the frame count and labels.
+
+    Hourly frames use the stored hour column; weekly frames need start_time.
+    """
+    labels = frame_labels(frames)
+    if frames == "hour":
+        return trips["hour"].to_numpy(), len(labels), labels
+    week = trips["start_time"].dt.isocalendar().week.astype("int64").to_numpy() - 1
+    return week, len(labels), labels
+
+def usage_counts(trips, n_stations, frames="hour"):
+    """Starts and ends per station code, and trip starts per (frame, station code)."""
+    starts, ends = station_counts(trips["start_station_code"], trips["end_station_code"], n_stations)
+    frame_ids, n_frames, _ = time_frames(trips, frames)
+    return starts, ends, frame_counts(frame_ids, trips["start_station_code"], n_frames, n_stations)
+
+def _partition_usage(frames, df):
+    return usage_counts(df, len(load_dictionary()), frames)
+
+def run(trips=None, stations=None, frames="hour", workers=None):
+    """Build the usage maps from the given trips, or straight from the trip
+    store (counted per partition in parallel) when trips is None."""
+    if stations is None:
+        stations = pd.read_csv(STATIONS_PATH)
+    os.makedirs(save_folder, exist_ok=True)
+
+    with profiling.step("aggregate", rows=None if trips is None else len(trips)):
+        # Count starts/ends per station code, and starts per time frame
+        dictionary = load_dictionary()
+        if trips is None:
+            columns = COLUMNS + (["start_time"] if frames == "week" else [])
+            usage = Aggregation(columns, partial(_partition_usage, frames), sum_partials)
+            starts, ends, counts = map_reduce(usage, workers=workers)
+        else:
+            starts, ends, counts = usage_counts(trips, len(dictionary), frames)
+        station_balance = balance_table(starts, ends, dictionary)
+
+        # Resolve each station code to coordinates once (id, name, then fuzzy name)
+        coordinates = station_coordinates(build_station_index(stations), dictionary)
+        station_balance = station_balance.join(
+            coordinates.set_index("code")[["latitude", "longitude", "match", "matched_name"]], on="code")
+        fuzzy = station_balance[station_balance["match"] == "fuzzy"]
+        if len(fuzzy):
+            print(f"{len(fuzzy)} station(s) matched to coordinates by a similar name:")
+            for name, matched_name in zip(fuzzy["station_name"], fuzzy["matched_name"]):
+                print(f"  {name} → {matched_name}")
+        unresolved = station_balance[station_balance["latitude"].isna()]
+        if len(unresolved):
+            print(f"{len(unresolved)} station(s) without coordinates left off the maps "
+                  f"({unresolved['total_activity'].sum():,} trip starts/ends), e.g. "
+                  f"{', '.join(unresolved.nlargest(3, 'total_activity')['station_name'])}")
+        station_balance = station_balance.dropna(subset=["latitude", "longitude"])
+
+    lat = station_balance["latitude"].to_numpy()
+    lon = station_balance["longitude"].to_numpy()
+
+    with profiling.step("folium"):
+        # Heatmap uses total activity for intensity
+        m = usage_heatmap(lat, lon, station_balance["total_activity"].to_numpy())
+        m.save(os.path.join(save_folder, "station_usage_heatmap.html"))
+        print("Heatmap saved: visuals/spatial/station_usage_heatmap.html")
+
+        # Colored circle markers based on net flow
+        m2 = net_flow_map(lat, lon, station_balance["net_flow"].to_numpy(), station_balance["station_name"])
+        m2.save(os.path.join(save_folder, "net_flow_map.html"))
+        print("Heatmap saved: visuals/net_flow_map.html")
+
+        # Animated heatmap of trip starts, one frame per hour of day or week of year
+        m3 = time_sliced_heatmap(counts[:, station_balance["code"].to_numpy()], lat, lon, frame_labels(frames))
+        m3.save(os.path.join(save_folder, f"station_usage_by_{frames}.html"))
+        print(f"Heatmap saved: visuals/spatial/station_usage_by_{frames}.html")
+
+    station_balance["location_type"] = station_zones(station_balance, load_zones())
+    summary = station_balance.groupby("location_type")[["starts", "ends", "total_activity"]].sum().reset_index()
+    print(summary)
+
+    # Plotting
+    net_flow = station_balance["net_flow"].to_numpy(dtype="float64")
+    bins, edges = bin_counts(net_flow, bins=30)
+    render(ChartSpec(
+        "hist", bins, os.path.join(save_folder, "net_flow_distribution.png"),
+        "Distribution of Net Bike Flow Across Stations",
+        xlabel="Net Flow (Starts - Ends)", ylabel="Number of Stations",
+        style={"bins": edges, "color": "skyblue", "edgecolor": "black"},
+        layout={
+            "curve": histogram_curve(net_flow, edges, bin_width=1),
+            "axvline": {"x": 0, "color": "red", "linestyle": "--", "linewidth": 1.5, "label": "Net Zero"},
+            "legend": True,
+        },
+    ))
+
+    print("Spatial plots are saved to visuals folder")
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Map station usage and net flow.")
+    parser.add_argument("--frames", choices=["hour", "week"], default="hour",
+                        help="Time slices of the animated usage heatmap")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for the per-partition aggregation and chart rendering (default: one per CPU)")
+    args = parser.parse_args(argv)
+    run(frames=args.frames, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from trip_store import PROCESSED_DATA_PATH, TRIPS_PATH, list_partitions, to_arrow
+from mapreduce import Aggregation, map_reduce, sum_partials
+
+DICTIONARY_PATH = os.path.join(PROCESSED_DATA_PATH, "station_dictionary.csv")
+
+# Station columns read from the trip store to grow the dictionary
+NAME_COLUMNS = ["start_station_id", "start_station_name", "end_station_id", "end_station_name"]
+
+def normalize_station_names(names):
+    return pd.Series(names, dtype="object").str.strip().str.lower()
+
+def load_dictionary(path=DICTIONARY_PATH):
+    """Station dictionary: one row per normalized name with its dense integer code."""
+    if not os.path.exists(path):
+        return pd.DataFrame({
+            "code": pd.Series(dtype="int32"),
+            "station_id": pd.Series(dtype="Int32"),
+            "station_name": pd.Series(dtype="object"),
+            "normalized_name": pd.Series(dtype="object"),
+        })
+    return pd.read_csv(path, dtype={"code": "int32", "station_id": "Int32"}, keep_default_na=False, na_values=[""])
+
+def update_dictionary(stations, path=DICTIONARY_PATH):
+    """Append stations not seen before; existing codes never change.
+
+    `stations` has station_name and station_id columns.
+    """
+    dictionary = load_dictionary(path)
+    stations = stations.dropna(subset=["station_name"]).assign(
+        normalized_name=lambda d: normalize_station_names(d["station_name"]).values
+    )
+    new = (
+        stations[~stations["normalized_name"].isin(dictionary["normalized_name"])]
+        .drop_duplicates("normalized_name")
+        .sort_values("normalized_name")
+    )
+    if not new.empty:
+        new = new.assign(code=np.arange(len(dictionary), len(dictionary) + len(new), dtype="int32"))
+        dictionary = pd.concat([dictionary, new[dictionary.columns]], ignore_index=True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        dictionary.to_csv(path, index=False)
+        print(f"Added {len(new)} station(s) to dictionary: {path}")
+    return dictionary
+
+def encode_stations(names, dictionary):
+    """Map a (categorical) station name column to int32 codes; unknown names get -1.
+
+    Only the distinct categories are normalized and looked up, the rows
+    themselves are mapped with one array take.
+    """
+    names = pd.Series(names).astype("category")
+    codes_by_name = pd.Series(dictionary["code"].values, index=dictionary["normalized_name"].values)
+    lookup = normalize_station_names(names.cat.categories).map(codes_by_name).fillna(-1).to_numpy(dtype="int32")
+    lookup = np.append(lookup, np.int32(-1))  # cat code -1 (missing) indexes the last slot
+    return lookup[names.cat.codes.to_numpy()]
+
+def with_station_codes(df, dictionary):
+    """Trips with start/end station code columns from the dictionary (names it lacks get -1)."""
+    return df.assign(start_station_code=encode_stations(df["start_station_name"], dictionary),
+                     end_station_code=encode_stations(df["end_station_name"], dictionary))
+
+def _partition_stations(path):
+    df = pd.read_parquet(path, columns=NAME_COLUMNS)
+    pairs = [
+        df[[f"{side}_station_name", f"{side}_station_id"]]
+        .drop_duplicates()
+        .set_axis(["station_name", "station_id"], axis=1)
+        for side in ("start", "end")
+    ]
+    return pd.concat(pairs, ignore_index=True)
+
+def encode_partition(path, dictionary_path=DICTIONARY_PATH):
+    """Rewrite one partition with start/end station code columns, one row group at a time."""
+    dictionary = load_dictionary(dictionary_path)
+    parquet_file = pq.ParquetFile(path)
+    tmp_path = path + ".tmp"
+    writer = None
+    try:
+        for i in range(parquet_file.num_row_groups):
+            df = parquet_file.read_row_group(i).to_pandas()
+            df["start_station_code"] = encode_stations(df["start_station_name"], dictionary)
+            df["end_station_code"] = encode_stations(df["end_station_name"], dictionary)
+            table = to_arrow(df)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(tmp_path, path)
+
+def _needs_codes(path, stations, known):
+    """True if a partition has no code columns yet, or has stations that were
+    not in the dictionary (`known` normalized names) it was encoded against."""
+    if "start_station_code" not in pq.read_schema(path).names:
+        return True
+    return not set(normalize_station_names(stations["station_name"].dropna())) <= known
+
+def encode_store(store_path=TRIPS_PATH, names=None, workers=None):
+    """Grow the dictionary from the given partitions (default: all) and fill in their station codes.
+
+    Partitions get their codes at ingest, from the dictionary as it was then;
+    only those holding stations it lacked (coded -1) are rewritten, once the
+    new stations have codes. Reading the station columns to find them is
+    cheap next to rewriting every partition.
+    """
+    partitions = list_partitions(store_path)
+    paths = [partitions[name] for name in (names or partitions)]
+    if not paths:
+        return load_dictionary()
+
+    stations = {path: _partition_stations(path) for path in paths}
+    known = set(load_dictionary()["normalized_name"])
+    dictionary = update_dictionary(pd.concat(stations.values(), ignore_index=True))
+    stale = [path for path in paths if _needs_codes(path, stations[path], known)]
+    if workers == 1 or len(stale) <= 1:
+        for path in stale:
+            encode_partition(path)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(encode_partition, stale))
+    return dictionary
+
+# Trip columns needed to count starts and ends per station
+CODE_COLUMNS = ["start_station_code", "end_station_code"]
+
+def station_counts(start_codes, end_codes, n_stations):
+    """Trips started and ended at every station code, counted with np.bincount (unknown codes skipped)."""
+    start_codes = np.asarray(start_codes)
+    end_codes = np.asarray(end_codes)
+    return (np.bincount(start_codes[start_codes >= 0], minlength=n_stations),
+            np.bincount(end_codes[end_codes >= 0], minlength=n_stations))
+
+def station_balance(start_codes, end_codes, dictionary):
+    """Starts, ends, net_flow and total_activity per station, counted with np.bincount over codes."""
+    return balance_table(*station_counts(start_codes, end_codes, len(dictionary)), dictionary)
+
+def _partition_counts(df):
+    return station_counts(df["start_station_code"], df["end_station_code"], len(load_dictionary()))
+
+def store_station_balance(store_path=TRIPS_PATH, workers=None):
+    """station_balance over the whole trip store, counted per partition in a process pool."""
+    dictionary = load_dictionary()
+    if not list_partitions(store_path):
+        return balance_table(np.zeros(len(dictionary), "int64"), np.zeros(len(dictionary), "int64"), dictionary)
+    starts, ends = map_reduce(Aggregation(CODE_COLUMNS, _partition_counts, sum_partials), store_path, workers)
+    return balance_table(starts, ends, dictionary)
+
+def balance_table(starts, ends, dictionary):
+    """Per-station table of start/end counts (indexed by code) with net_flow and total_activity."""
+    n = len(dictionary)
+    balance = pd.DataFrame({
+        "code": np.arange(n, dtype="int32"),
+        "station_name": dictionary.sort_values("code")["normalized_name"].values,
+        "starts": starts,
+        "ends": ends,
+    })
+    balance["net_flow"] = balance["starts"] - balance["ends"]
+    balance["total_activity"] = balance["starts"] + balance["ends"]
+    return balance[balance["total_activity"] > 0].reset_index(drop=True)
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(
+        prog=prog, description="Grow the station dictionary from the trip store and fill in station codes.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for rewriting partitions with new stations (1 = sequential)")
+    args = parser.parse_args(argv)
+    dictionary = encode_store(workers=args.workers)
+    print(f"Station dictionary has {len(dictionary)} stations")
+
+if __name__ == "__main__":
+    main()
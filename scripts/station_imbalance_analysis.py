@@ -1,50 +1,76 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+import argparse
+import numpy as np
+import pandas as pd
+from charts import ChartSpec, render_all
+import profiling
+from station_dictionary import load_dictionary, station_balance as compute_station_balance, store_station_balance
+from net_flow import load_net_flow, inventory_drift
 
 save_folder = "visuals/station_imbalance"
-os.makedirs(save_folder, exist_ok=True)
-
-# Load the cleaned combined CSV
-DATA_PATH = "data/processed/bikeshare_2023_combined.csv"
-df = pd.read_csv(DATA_PATH)
-
-df["start_station_name"] = df["start_station_name"].str.strip().str.lower()
-df["end_station_name"] = df["end_station_name"].str.strip().str.lower()
-
-start_counts = df["start_station_name"].value_counts()
-end_counts = df["end_station_name"].value_counts()
-
-station_balance = pd.DataFrame({
-    "starts" : start_counts,
-    "ends" : end_counts
-}).fillna(0)
-
-station_balance["net_flow"] = station_balance["starts"] - station_balance["ends"]
-station_balance["total_activity"] = station_balance["starts"] + station_balance["ends"]
-
-top_exporters = station_balance.sort_values(by="net_flow", ascending=False).head(10)
-top_importers = station_balance.sort_values(by="net_flow", ascending=True).head(10)
-
-# Exporters
-plt.figure(figsize=(10, 6))
-sns.barplot(x=top_exporters["net_flow"], y=top_exporters.index, palette="Blues_d")
-plt.title("Top 10 Stations: More Trips Started Than Ended (Exporters)")
-plt.xlabel("Net Flow (Starts - Ends)")
-plt.ylabel("Station Name")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "top_station_exporters.png"))
-plt.clf()
-
-# Importers
-plt.figure(figsize=(10, 6))
-sns.barplot(x=top_importers["net_flow"], y=top_importers.index, palette="Reds_d")
-plt.title("Top 10 Stations: More Trips Ended Than Started (Importers)")
-plt.xlabel("Net Flow (Starts - Ends)")
-plt.ylabel("Station Name")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "top_station_importers.png"))
-plt.clf()
-
-print("Station imbalance plots are saved to visuals folder")
\ No newline at end of file
+
+# Trip columns this analysis reads from the processed trip store
+COLUMNS = ["start_station_code", "end_station_code"]
+
+# Stations per side (exporters / importers) in the inventory drift chart
+DRIFT_STATIONS = 5
+
+def average_drift(net, stations):
+    """Mean bikes gained since midnight per time of day for the given stations, in long format."""
+    drift = inventory_drift(net, stations=stations["code"].to_numpy()).mean(axis=0)
+    hours = np.arange(drift.shape[0]) * net.bucket_minutes / 60
+    return pd.DataFrame({
+        "hour": np.repeat(hours, drift.shape[1]),
+        "station_name": np.tile(stations["station_name"].to_numpy(), drift.shape[0]),
+        "drift": drift.ravel(),
+    })
+
+def run(df=None, workers=None, top=10):
+    """Render the exporter / importer charts (top stations per side) from the
+    given trips, or straight from the trip store (counted per partition in
+    parallel) when df is None."""
+    os.makedirs(save_folder, exist_ok=True)
+
+    with profiling.step("aggregate", rows=None if df is None else len(df)):
+        if df is None:
+            station_balance = store_station_balance(workers=workers)
+        else:
+            station_balance = compute_station_balance(
+                df["start_station_code"], df["end_station_code"], load_dictionary()
+            )
+        station_balance = station_balance.set_index("station_name")
+
+    top_exporters = station_balance.sort_values(by="net_flow", ascending=False).head(top).reset_index()
+    top_importers = station_balance.sort_values(by="net_flow", ascending=True).head(top).reset_index()
+    columns = ["station_name", "starts", "ends", "net_flow"]
+    print("Top exporters:\n", top_exporters[columns].to_string(index=False))
+    print("Top importers:\n", top_importers[columns].to_string(index=False))
+    with profiling.step("drift"):
+        drift = average_drift(load_net_flow(), pd.concat([top_exporters.head(DRIFT_STATIONS),
+                                                          top_importers.head(DRIFT_STATIONS)]))
+
+    render_all([
+        ChartSpec("bar", top_exporters, os.path.join(save_folder, "top_station_exporters.png"),
+                  f"Top {top} Stations: More Trips Started Than Ended (Exporters)", x="net_flow", y="station_name",
+                  xlabel="Net Flow (Starts - Ends)", ylabel="Station Name", style={"palette": "Blues_d"}),
+        ChartSpec("bar", top_importers, os.path.join(save_folder, "top_station_importers.png"),
+                  f"Top {top} Stations: More Trips Ended Than Started (Importers)", x="net_flow", y="station_name",
+                  xlabel="Net Flow (Starts - Ends)", ylabel="Station Name", style={"palette": "Reds_d"}),
+        ChartSpec("line", drift, os.path.join(save_folder, "inventory_drift_by_hour.png"),
+                  "Average Inventory Drift Over the Day (Top Exporters and Importers)", x="hour", y="drift",
+                  hue="station_name", xlabel="Hour of Day", ylabel="Bikes Gained Since Midnight (Ends - Starts)",
+                  figsize=(12, 6), layout={"legend_title": "Station"}),
+    ], workers=workers)
+
+    print("Station imbalance plots are saved to visuals folder")
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Rank stations by net flow and chart the top exporters and importers.")
+    parser.add_argument("--top", type=int, default=10, help="Stations per side (exporters / importers)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for the per-partition aggregation and chart rendering (default: one per CPU)")
+    args = parser.parse_args(argv)
+    run(workers=args.workers, top=args.top)
+
+if __name__ == "__main__":
+    main()
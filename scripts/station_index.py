@@ -0,0 +1,194 @@
+import os
+import json
+import argparse
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from matplotlib.path import Path
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.neighbors import BallTree, NearestNeighbors
+from station_dictionary import load_dictionary, normalize_station_names
+
+STATIONS_PATH = "data/stations_with_coords_clean.csv"
+# Optional GeoJSON FeatureCollection of zone polygons, each with a "name" property;
+# without it stations are zoned by SUBURBAN_KEYWORDS
+ZONES_PATH = "data/zones.geojson"
+EARTH_RADIUS_M = 6_371_000
+
+# Cosine similarity of character trigram vectors a fuzzy name match must reach
+FUZZY_MIN_SIMILARITY = 0.75
+# Most similar names checked for a fuzzy match; the first naming the same streets wins
+FUZZY_CANDIDATES = 5
+# Street types, street directions and filler words; the remaining tokens (street
+# names, house numbers, "east" / "west" of a park, ...) must be the same for a
+# fuzzy match, so "285 Victoria St" never matches "Victoria St / Queen St E"
+GENERIC_TOKENS = {
+    "st", "street", "ave", "av", "avenue", "rd", "road", "blvd", "boulevard", "dr", "drive", "cres", "crt", "ct",
+    "pl", "ln", "sq", "pkwy", "hwy", "trl", "ter", "e", "w", "n", "s", "at", "and", "of", "the",
+}
+SUBURBAN_KEYWORDS = ["north york", "scarborough", "etobicoke", "eglinton", "kipling", "kennedy", "finch"]
+
+# Lookup structures over the stations with known coordinates, built once: exact
+# id / name maps, canonical name map, a trigram TF-IDF index for fuzzy names
+# and a BallTree on (lat, lon) in radians for distance queries.
+StationIndex = namedtuple("StationIndex", ["stations", "by_id", "by_name", "by_canonical", "vectorizer", "names", "tree"])
+
+def canonical_names(names):
+    """Names reduced for matching: lowercase, no "SMART" tag, punctuation and repeated spaces removed."""
+    return (
+        normalize_station_names(names)
+        .str.replace(r"\bsmart\b", " ", regex=True)
+        .str.replace(r"[^0-9a-z]+", " ", regex=True)
+        .str.split()
+        .str.join(" ")
+    )
+
+def street_tokens(canonical):
+    """Street name and number tokens of a canonical name, ignoring order and GENERIC_TOKENS."""
+    return frozenset(token for token in canonical.split() if token not in GENERIC_TOKENS)
+
+def same_streets(a, b):
+    """True if two canonical names have the same street name and number tokens."""
+    tokens = street_tokens(a)
+    return bool(tokens) and tokens == street_tokens(b)
+
+def _lookup(keys):
+    rows = pd.Series(np.arange(len(keys)), index=keys)
+    return rows[~rows.index.duplicated() & rows.index.notna()]
+
+def build_station_index(stations):
+    """Index stations (station_name, latitude, longitude, optional station_id) for resolution and distance queries."""
+    stations = stations.dropna(subset=["latitude", "longitude"]).reset_index(drop=True)
+    canonical = canonical_names(stations["station_name"])
+    vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 3)).fit(canonical)
+    return StationIndex(
+        stations=stations,
+        by_id=_lookup(stations["station_id"].to_numpy()) if "station_id" in stations else pd.Series(dtype="int64"),
+        by_name=_lookup(normalize_station_names(stations["station_name"]).to_numpy()),
+        by_canonical=_lookup(canonical.to_numpy()),
+        vectorizer=vectorizer,
+        names=NearestNeighbors(n_neighbors=1, metric="cosine").fit(vectorizer.transform(canonical)),
+        tree=BallTree(np.radians(stations[["latitude", "longitude"]].to_numpy()), metric="haversine"),
+    )
+
+def load_station_index(path=STATIONS_PATH):
+    return build_station_index(pd.read_csv(path))
+
+def resolve(index, names, ids=None):
+    """Row of index.stations for every name (-1 if unresolved) and how it matched.
+
+    Tried in order: station id, exact normalized name, canonical name, then
+    the most similar name in the trigram index that is similar enough and
+    names the same streets (see same_streets).
+    """
+    names = pd.Series(names, dtype="object").reset_index(drop=True)
+    rows = np.full(len(names), -1, dtype="int64")
+    method = np.full(len(names), "", dtype=object)
+
+    def fill(found, label):
+        found = found.to_numpy(dtype="float64")
+        hit = (rows < 0) & ~np.isnan(found)
+        rows[hit] = found[hit]
+        method[hit] = label
+
+    if ids is not None and len(index.by_id):
+        fill(pd.Series(ids, dtype="object").reset_index(drop=True).map(index.by_id), "id")
+    fill(normalize_station_names(names).map(index.by_name), "exact")
+    canonical = canonical_names(names)
+    fill(canonical.map(index.by_canonical), "normalized")
+
+    pending = np.flatnonzero((rows < 0) & names.notna().to_numpy())
+    if len(pending):
+        queries = canonical.iloc[pending].fillna("")
+        distance, nearest = index.names.kneighbors(index.vectorizer.transform(queries),
+                                                   n_neighbors=min(FUZZY_CANDIDATES, len(index.stations)))
+        candidates = canonical_names(index.stations["station_name"]).to_numpy()
+        for i, query in enumerate(queries):
+            for d, row in zip(distance[i], nearest[i]):
+                if 1 - d < FUZZY_MIN_SIMILARITY:
+                    break
+                if same_streets(query, candidates[row]):
+                    rows[pending[i]] = row
+                    method[pending[i]] = "fuzzy"
+                    break
+    return rows, method
+
+def station_coordinates(index, dictionary=None):
+    """Coordinates of every dictionary code, resolved once per station; trips then map through codes.
+
+    `matched_name` is the stations file name a station resolved to; unresolved
+    stations keep NaN coordinates and an empty `match` and `matched_name`.
+    """
+    dictionary = (load_dictionary() if dictionary is None else dictionary).sort_values("code")
+    rows, method = resolve(index, dictionary["station_name"], dictionary["station_id"])
+    coordinates = index.stations[["latitude", "longitude"]].to_numpy()
+    located = np.where(rows[:, None] >= 0, coordinates[np.maximum(rows, 0)], np.nan)
+    matched = np.where(rows >= 0, index.stations["station_name"].to_numpy(dtype=object)[np.maximum(rows, 0)], "")
+    return pd.DataFrame({
+        "code": dictionary["code"].to_numpy(),
+        "station_name": dictionary["normalized_name"].to_numpy(),
+        "latitude": located[:, 0],
+        "longitude": located[:, 1],
+        "match": method,
+        "matched_name": matched,
+    })
+
+def nearest_stations(index, lat, lon, k=1):
+    """Distances (meters) to and rows of the k stations nearest each point, closest first."""
+    points = np.radians(np.column_stack([np.atleast_1d(lat), np.atleast_1d(lon)]))
+    distance, rows = index.tree.query(points, k=k)
+    return distance * EARTH_RADIUS_M, rows
+
+def stations_within(index, lat, lon, radius_m):
+    """Rows of the stations within radius_m of each point (one array per point)."""
+    points = np.radians(np.column_stack([np.atleast_1d(lat), np.atleast_1d(lon)]))
+    return index.tree.query_radius(points, r=radius_m / EARTH_RADIUS_M)
+
+def load_zones(path=ZONES_PATH):
+    """(name, polygon paths) per zone from a GeoJSON file, or None if there is no zones file.
+
+    Only exterior rings are used; coordinates are GeoJSON (lon, lat).
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        features = json.load(f)["features"]
+    zones = []
+    for feature in features:
+        geometry = feature["geometry"]
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        zones.append((feature["properties"]["name"], [Path(np.asarray(polygon[0])) for polygon in polygons]))
+    return zones
+
+def assign_zones(lat, lon, zones, default="Other"):
+    """Zone name of every point; the first zone containing a point wins."""
+    points = np.column_stack([lon, lat])
+    assigned = np.full(len(points), default, dtype=object)
+    for name, paths in zones:
+        inside = np.zeros(len(points), dtype=bool)
+        for path in paths:
+            inside |= path.contains_points(points)
+        assigned[inside & (assigned == default)] = name
+    return assigned
+
+def keyword_zones(names):
+    """"Suburban" for station names containing a SUBURBAN_KEYWORDS entry, else "Downtown"."""
+    pattern = "|".join(SUBURBAN_KEYWORDS)
+    suburban = pd.Series(names, dtype="object").str.lower().str.contains(pattern, regex=True, na=False)
+    return np.where(suburban, "Suburban", "Downtown").astype(object)
+
+def station_zones(stations, zones=None):
+    """Zone of every station row (station_name, latitude, longitude): from polygons if given, else keywords."""
+    if zones is None:
+        return keyword_zones(stations["station_name"])
+    return assign_zones(stations["latitude"].to_numpy(), stations["longitude"].to_numpy(), zones)
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Resolve dictionary stations to coordinates.")
+    parser.add_argument("--stations", default=STATIONS_PATH)
+    args = parser.parse_args(argv)
+    coordinates = station_coordinates(load_station_index(args.stations))
+    print(coordinates["match"].replace("", "unresolved").value_counts().to_string())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+RAW_COLUMNS = [
+    "Trip Id", "Trip  Duration", "Start Station Id", "Start Time", "Start Station Name",
+    "End Station Id", "End Time", "End Station Name", "Bike Id", "User Type",
+]
+TIME_FORMAT = "%m/%d/%Y %H:%M"
+
+# Rough bounding box of the Toronto service area
+LATITUDE_RANGE = (43.60, 43.78)
+LONGITUDE_RANGE = (-79.55, -79.28)
+
+# Share of trips starting in each hour: morning and evening commute peaks
+HOURLY_WEIGHTS = np.array([
+    1, 0.6, 0.4, 0.3, 0.3, 0.8, 2, 4.5, 7, 4.5, 3.5, 4,
+    5, 5, 4.8, 5.2, 6.5, 8.5, 7, 5.5, 4.5, 3.5, 2.5, 1.6,
+])
+CASUAL_SHARE = 0.3
+MISSING_END_STATION_SHARE = 0.001
+CHUNK_ROWS = 1_000_000
+
+# Kept apart from data/ so the curated stations file is never overwritten
+SYNTHETIC_ROOT = "benchmarks/work"
+
+def generate_stations(n_stations, seed=0):
+    """Stations with unique names, ids and coordinates, in the stations_with_coords_clean.csv layout."""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(n_stations) + 7000
+    streets = pd.Series(np.arange(n_stations) // 4 + 1).astype(str)
+    avenues = pd.Series(np.arange(n_stations) % 4 + 1).astype(str)
+    return pd.DataFrame({
+        "station_id": ids,
+        "station_name": "Street " + streets + " / Avenue " + avenues,
+        "latitude": rng.uniform(*LATITUDE_RANGE, n_stations).round(6),
+        "longitude": rng.uniform(*LONGITUDE_RANGE, n_stations).round(6),
+    })
+
+def station_weights(n_stations, skew):
+    """Zipf-like popularity: station of rank r gets weight 1 / r**skew (skew=0 is uniform)."""
+    weights = 1 / np.arange(1, n_stations + 1) ** skew
+    return weights / weights.sum()
+
+def generate_trips(rows, stations, year, month, skew=1.0, rng=None, first_trip_id=0):
+    """One chunk of trips for a month, in the raw CSV schema clean_data reads."""
+    rng = rng or np.random.default_rng()
+    weights = station_weights(len(stations), skew)
+    start = rng.choice(len(stations), size=rows, p=weights)
+    end = rng.choice(len(stations), size=rows, p=weights)
+
+    month_start = pd.Timestamp(year, month, 1)
+    days = month_start.days_in_month
+    hours = rng.choice(24, size=rows, p=HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum())
+    offsets = rng.integers(0, days, rows) * 86400 + hours * 3600 + rng.integers(0, 3600, rows)
+    start_time = month_start + pd.to_timedelta(offsets, unit="s")
+
+    casual = rng.random(rows) < CASUAL_SHARE
+    # Casual riders take longer trips; both are right-skewed
+    duration = np.where(casual, rng.lognormal(7.3, 0.7, rows), rng.lognormal(6.6, 0.55, rows))
+    duration = np.clip(duration, 60, 86400).astype("int64")
+    end_time = start_time + pd.to_timedelta(duration, unit="s")
+
+    names = stations["station_name"].to_numpy(dtype=object)
+    end_names = names[end].copy()
+    end_names[rng.random(rows) < MISSING_END_STATION_SHARE] = "NULL"
+
+    return pd.DataFrame({
+        "Trip Id": np.arange(first_trip_id, first_trip_id + rows),
+        "Trip  Duration": duration,
+        "Start Station Id": stations["station_id"].to_numpy()[start],
+        "Start Time": start_time.strftime(TIME_FORMAT),
+        "Start Station Name": names[start],
+        "End Station Id": stations["station_id"].to_numpy()[end],
+        "End Time": end_time.strftime(TIME_FORMAT),
+        "End Station Name": end_names,
+        "Bike Id": rng.integers(1, 8000, rows),
+        "User Type": np.where(casual, "Casual Member", "Annual Member"),
+    }, columns=RAW_COLUMNS)
+
+def write_dataset(output_root=SYNTHETIC_ROOT, rows=1_000_000, n_stations=600, skew=1.0, year=2023, seed=0):
+    """Write 12 monthly raw CSVs and the matching stations file under `output_root`.
+
+    Files land where the pipeline looks for them (data/raw/bikeshare-ridership-<year>/
+    and data/stations_with_coords_clean.csv). Months are written in chunks so
+    50M-row datasets do not need to fit in memory.
+    """
+    rng = np.random.default_rng(seed)
+    stations = generate_stations(n_stations, seed)
+    raw_dir = os.path.join(output_root, "data", "raw", f"bikeshare-ridership-{year}")
+    os.makedirs(raw_dir, exist_ok=True)
+    stations[["station_name", "latitude", "longitude"]].to_csv(
+        os.path.join(output_root, "data", "stations_with_coords_clean.csv"), index=False)
+
+    rows_per_month = np.full(12, rows // 12)
+    rows_per_month[: rows % 12] += 1
+    trip_id = 0
+    for month, month_rows in enumerate(rows_per_month, start=1):
+        path = os.path.join(raw_dir, f"Bike share ridership {year}-{month:02d}.csv")
+        with open(path, "w", encoding="ISO-8859-1", newline="") as f:
+            for i, chunk_start in enumerate(range(0, month_rows, CHUNK_ROWS)):
+                chunk_rows = min(CHUNK_ROWS, month_rows - chunk_start)
+                chunk = generate_trips(chunk_rows, stations, year, month, skew, rng, trip_id)
+                chunk.to_csv(f, index=False, header=i == 0)
+                trip_id += chunk_rows
+        print(f"Wrote {month_rows:,} trips to {path}")
+    return raw_dir
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog,
+                                     description="Generate synthetic ridership data in the raw Bike Share Toronto schema.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Total trips over the year")
+    parser.add_argument("--stations", type=int, default=600, help="Number of stations")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of station popularity (0 = uniform)")
+    parser.add_argument("--year", type=int, default=2023)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=SYNTHETIC_ROOT, help="Root directory to write data/ under")
+    args = parser.parse_args(argv)
+
+    write_dataset(args.output, args.rows, args.stations, args.skew, args.year, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import json
+import argparse
+import pandas as pd
+import clean_data
+import artifact_cache
+from duration_sketch import sketch_trips, merge_sketches
+from station_dictionary import encode_store
+from mapreduce import map_partitions
+from trip_store import PROCESSED_DATA_PATH, TRIPS_PATH, TIME_FEATURES, add_time_features, list_partitions
+
+CUBE_DIR = os.path.join(PROCESSED_DATA_PATH, "trip_cube")
+CUBE_PATH = os.path.join(CUBE_DIR, "cube.parquet")
+PARTS_DIR = os.path.join(CUBE_DIR, "parts")
+# Source fingerprint of every month aggregated, and the trip store version the cube was built from
+MANIFEST_PATH = os.path.join(CUBE_DIR, "manifest.json")
+# Duration quantile sketches, kept per month next to the cube parts
+SKETCH_PATH = os.path.join(CUBE_DIR, "duration_sketch.parquet")
+SKETCH_PARTS_DIR = os.path.join(CUBE_DIR, "sketch_parts")
+
+# Trips longer than this are flagged so duration means can exclude outliers
+LONG_TRIP_MIN = 120
+
+DIMENSIONS = ["year", "month", "day_of_week", "hour", "user_type", "start_station_name", "long_trip"]
+MEASURES = ["trips", "duration_sum", "duration_sqsum"]
+CATEGORY_DIMENSIONS = ["month", "day_of_week", "user_type", "start_station_name"]
+
+# Trip columns needed to aggregate one partition
+COLUMNS = ["trip_duration", "user_type", "start_station_name"] + TIME_FEATURES
+
+def aggregate_trips(df):
+    """Collapse raw trips into cube rows: counts, duration sums and sums of squares (seconds)."""
+    duration = df["trip_duration"].astype("float64")
+    df = add_time_features(df[COLUMNS]).assign(
+        long_trip=duration > LONG_TRIP_MIN * 60,
+        duration_sum=duration,
+        duration_sqsum=duration ** 2,
+    )
+    cube = (
+        df.groupby(DIMENSIONS, observed=True)
+        .agg(trips=("duration_sum", "size"), duration_sum=("duration_sum", "sum"), duration_sqsum=("duration_sqsum", "sum"))
+        .reset_index()
+    )
+    return _compact(cube)
+
+def merge_cubes(cubes):
+    """Sum partial cubes; every measure is additive so order does not matter."""
+    combined = pd.concat(cubes, ignore_index=True)
+    merged = combined.groupby(DIMENSIONS, observed=True, as_index=False)[MEASURES].sum()
+    return _compact(merged)
+
+def _compact(cube):
+    for col in CATEGORY_DIMENSIONS:
+        cube[col] = cube[col].astype("category")
+    cube["year"] = cube["year"].astype("uint16")
+    cube["hour"] = cube["hour"].astype("uint8")
+    cube["trips"] = cube["trips"].astype("int64")
+    return cube
+
+def _source_fingerprints(raw_path):
+    """Fingerprint of every monthly source, keyed by partition name."""
+    raw_paths = [path for path in (raw_path if isinstance(raw_path, (list, tuple)) else [raw_path])
+                 if os.path.exists(path)]
+    return {
+        clean_data.partition_name(source): clean_data.source_fingerprint(source)
+        for source in clean_data.list_monthly_csvs(raw_paths)
+    }
+
+def _load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+def is_current(store_path=TRIPS_PATH):
+    """True if the cube and duration sketch were built from the trip store as it is now,
+    i.e. it was not re-ingested (e.g. by `bikeshare clean`) since."""
+    if not os.path.exists(CUBE_PATH) or not os.path.exists(SKETCH_PATH):
+        return False
+    built_from = _load_manifest().get("trip_store")
+    return built_from is not None and built_from == artifact_cache.path_digest(store_path)
+
+def _aggregate_partition(path):
+    """Write the partial cube and duration sketch of one trip store partition."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    df = add_time_features(pd.read_parquet(path, columns=COLUMNS))
+    aggregate_trips(df).to_parquet(os.path.join(PARTS_DIR, f"{name}.parquet"), index=False)
+    sketch_trips(df).to_parquet(os.path.join(SKETCH_PARTS_DIR, f"{name}.parquet"), index=False)
+
+def _read_parts(parts_dir):
+    return [pd.read_parquet(os.path.join(parts_dir, file)) for file in sorted(os.listdir(parts_dir))]
+
+def _save(sources, store_path):
+    merge_cubes(_read_parts(PARTS_DIR)).to_parquet(CUBE_PATH, index=False)
+    merge_sketches(_read_parts(SKETCH_PARTS_DIR)).to_parquet(SKETCH_PATH, index=False)
+    manifest = {"trip_store": artifact_cache.path_digest(store_path), "sources": sources}
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def build_cube(store_path=TRIPS_PATH, raw_path=None, workers=None):
+    """Rebuild the whole cube and duration sketch from the trip store.
+
+    Each partition is aggregated on its own in a process pool (map); the
+    partial cubes and sketches are then merged (reduce).
+    """
+    fingerprints = _source_fingerprints(raw_path or clean_data.default_raw_sources())
+    for parts_dir in (PARTS_DIR, SKETCH_PARTS_DIR):
+        os.makedirs(parts_dir, exist_ok=True)
+        for file in os.listdir(parts_dir):
+            os.remove(os.path.join(parts_dir, file))
+
+    partitions = list_partitions(store_path)
+    map_partitions(_aggregate_partition, partitions.values(), workers)
+    sources = {name: fingerprints.get(name) for name in partitions}
+    _save(sources, store_path)
+    print(f"Trip cube built from {len(sources)} partition(s): {CUBE_PATH}")
+
+def update_cube(raw_path=None, store_path=TRIPS_PATH):
+    """Fold new or changed monthly CSVs into the cube without rescanning the other months.
+
+    Each changed file is ingested into its own trip store partition and
+    aggregated on its own; the other months' partial cubes are reused.
+    """
+    raw_path = raw_path or clean_data.default_raw_sources()
+    if not is_current(store_path):
+        build_cube(store_path, raw_path)
+
+    sources = _load_manifest()["sources"]
+    updated = []
+    for file_path in clean_data.list_monthly_csvs(raw_path):
+        name = clean_data.partition_name(file_path)
+        fingerprint = clean_data.source_fingerprint(file_path)
+        if sources.get(name) == fingerprint:
+            continue
+        print(f"Folding {file_path} into the trip cube")
+        clean_data.ingest_month(file_path, store_path)
+        encode_store(store_path, [name], workers=1)
+        _aggregate_partition(list_partitions(store_path)[name])
+        sources[name] = fingerprint
+        updated.append(name)
+
+    if updated:
+        _save(sources, store_path)
+    print(f"Trip cube updated with {len(updated)} month(s)")
+    return updated
+
+def load_cube(path=CUBE_PATH):
+    """Load the materialized cube, (re)building it if it is missing or older than the trip store."""
+    if not os.path.exists(path) or not is_current():
+        build_cube()
+    return pd.read_parquet(path)
+
+def load_duration_sketch(path=SKETCH_PATH):
+    """Load the merged duration sketch, (re)building the cube and sketches if it is missing or stale."""
+    if not os.path.exists(path) or not is_current():
+        build_cube()
+    return pd.read_parquet(path)
+
+def rollup(cube, by, long_trips=True):
+    """Sum the cube over every dimension not in `by`; adds mean duration in minutes."""
+    if not long_trips:
+        cube = cube[~cube["long_trip"]]
+    result = cube.groupby(by, observed=True, as_index=False)[MEASURES].sum()
+    result["mean_duration_min"] = result["duration_sum"] / result["trips"] / 60
+    return result
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Fold new or changed monthly CSVs into the trip cube.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the whole cube from the trip store")
+    args = parser.parse_args(argv)
+    if args.rebuild:
+        build_cube()
+    else:
+        update_cube()
+
+if __name__ == "__main__":
+    main()
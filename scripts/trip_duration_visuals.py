@@ -1,91 +1,88 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+import argparse
+from trip_store import DAY_NAMES, load_trips
+from trip_cube import load_duration_sketch
+from charts import ChartSpec, bin_counts, render_all
+import profiling
+from duration_sketch import box_stats, means, outlier_cutoff, quantiles, DIMENSIONS as SKETCH_DIMENSIONS
+from density import DURATION_BIN_MIN, grouped_kde
 
 save_folder = "visuals/trip_duration"
-os.makedirs(save_folder, exist_ok=True)
-
-# Setup for prettier plot
-sns.set(style="whitegrid")
-plt.rcParams["figure.figsize"] = (10, 6)
-
-# Load the cleaned combined CSV
-DATA_PATH = "data/processed/bikeshare_2023_combined.csv"
-df = pd.read_csv(DATA_PATH)
-
-print(f"Original shape: {df.shape}")
-df.dropna(inplace=True)
-print(f"New shape after dropping NaNs: {df.shape}")
-
-day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-
-# Standardize column names
-df.columns = (
-    df.columns
-    .str.strip()
-    .str.lower()
-    .str.replace(" ", "_")
-    .str.replace("__", "_")
-)
-
-print(f"Data Loaded: {df.shape[0]:,} rows, {df.shape[1]} columns")
-print("Columns: ", list(df.columns))
-
-# Convert to datatime
-df["start_time"] = pd.to_datetime(df["start_time"], errors="coerce")
-df["end_time"] = pd.to_datetime(df["end_time"], errors="coerce")
-
-# Add time-related features
-df["hour"] = df["start_time"].dt.hour
-df["day_of_week"] = df["start_time"].dt.day_name()
-df["month"] = df["start_time"].dt.month_name()
-
-# Convert trip_duration to minutes
-df["trip_duration_min"] = df["trip_duration"] / 60
-filtered_df = df[df["trip_duration_min"] <= 120]
-
-plt.figure(figsize=(10, 6))
-sns.histplot(filtered_df["trip_duration_min"], bins=60, kde=False, color="skyblue")
-plt.title("Trip Duration Distribution (All Users)")
-plt.xlabel("Trip Duration (minutes)")
-plt.ylabel("Number of Trips")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trip_duration_histogram_all.png"))
-plt.clf()
-
-plt.figure(figsize=(10, 6))
-sns.kdeplot(data=filtered_df, x="trip_duration_min", hue="user_type", common_norm=False)
-plt.title("Trip Duration KDE by User Type")
-plt.xlabel("Trip Duration (minutes)")
-plt.ylabel("Density")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trip_duration_kde_usertype.png"))
-plt.clf()
-
-plt.figure(figsize=(8, 6))
-sns.boxplot(data=filtered_df, x="user_type", y="trip_duration_min")
-plt.title("Trip Duration by User Type")
-plt.xlabel("User Type")
-plt.ylabel("Trip Duration (minutes)")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "trip_duration_boxplot_usertype.png"))
-plt.clf()
-
-# Group and aggregate
-avg_duration = (
-    filtered_df.groupby(["day_of_week", "user_type"])["trip_duration_min"]
-    .mean()
-    .reset_index()
-)
-
-plt.figure(figsize=(10, 6))
-sns.barplot(data=avg_duration, x="day_of_week", y="trip_duration_min", hue="user_type", order=day_order)
-plt.title("Average Trip Duration by Day and User Type")
-plt.xlabel("Day of Week")
-plt.ylabel("Avg Trip Duration (minutes)")
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, "avg_trip_duration_by_day_user.png"))
-plt.clf()
-
-print("Trip duration plots are saved to visuals folder")
\ No newline at end of file
+
+# Trip columns this analysis reads from the processed trip store
+COLUMNS = ["trip_duration", "user_type"]
+
+day_order = DAY_NAMES
+
+# Trips above this quantile of all durations are left out of every chart
+OUTLIER_QUANTILE = 0.99
+
+def chart_specs(df, sketch):
+    """One chart spec per trip duration figure, each drawn from a small aggregate of the trips."""
+    cutoff = outlier_cutoff(sketch, OUTLIER_QUANTILE)
+
+    # Convert trip_duration to minutes
+    duration_min = df["trip_duration"] / 60
+    keep = (duration_min <= cutoff / 60).to_numpy()
+    duration_min = duration_min.to_numpy()[keep]
+    user_type = df["user_type"].to_numpy()[keep]
+
+    histogram, edges = bin_counts(duration_min, bins=60)
+    density = grouped_kde(duration_min, user_type, DURATION_BIN_MIN)
+
+    # Mean duration per day and user type below the same cutoff, from the sketch buckets
+    avg_duration = means(sketch, ["day_of_week", "user_type"], upper=cutoff)
+    avg_duration["trip_duration_min"] = avg_duration["mean"] / 60
+
+    return [
+        ChartSpec("hist", histogram, os.path.join(save_folder, "trip_duration_histogram_all.png"),
+                  "Trip Duration Distribution (All Users)", xlabel="Trip Duration (minutes)", ylabel="Number of Trips",
+                  style={"bins": edges, "kde": False, "color": "skyblue"}),
+        ChartSpec("kde", density, os.path.join(save_folder, "trip_duration_kde_usertype.png"),
+                  "Trip Duration KDE by User Type", hue="group", xlabel="Trip Duration (minutes)", ylabel="Density",
+                  layout={"legend_title": "user_type"}),
+        ChartSpec("box", box_stats(sketch, "user_type", upper=cutoff, scale=1 / 60),
+                  os.path.join(save_folder, "trip_duration_boxplot_usertype.png"),
+                  "Trip Duration by User Type", xlabel="User Type", ylabel="Trip Duration (minutes)", figsize=(8, 6)),
+        ChartSpec("bar", avg_duration, os.path.join(save_folder, "avg_trip_duration_by_day_user.png"),
+                  "Average Trip Duration by Day and User Type",
+                  x="day_of_week", y="trip_duration_min", hue="user_type", order=day_order,
+                  xlabel="Day of Week", ylabel="Avg Trip Duration (minutes)"),
+    ]
+
+def percentile_table(sketch):
+    """p50/p95/p99 duration in minutes per user type, day and hour, from the sketch."""
+    table = quantiles(sketch, by=SKETCH_DIMENSIONS)
+    for col in ["p50", "p95", "p99"]:
+        table[col] = (table[col] / 60).round(1)
+    return table
+
+def run(df=None, sketch=None, workers=None):
+    if df is None:
+        df = load_trips(columns=COLUMNS)
+    if sketch is None:
+        sketch = load_duration_sketch()
+    os.makedirs(save_folder, exist_ok=True)
+
+    print(f"Data Loaded: {df.shape[0]:,} rows, {df.shape[1]} columns")
+    print("Columns: ", list(df.columns))
+
+    by_user = quantiles(sketch, by=["user_type"])
+    print("Trip duration percentiles (minutes):")
+    print(by_user.assign(**{col: (by_user[col] / 60).round(1) for col in ["p50", "p95", "p99"]}).to_string(index=False))
+    percentile_table(sketch).to_csv(os.path.join(save_folder, "duration_percentiles.csv"), index=False)
+
+    with profiling.step("aggregate", rows=len(df)):
+        specs = chart_specs(df, sketch)
+    render_all(specs, workers=workers)
+    print("Trip duration plots are saved to visuals folder")
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Render the trip duration charts from the trip store.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for the per-partition aggregation and chart rendering (default: one per CPU)")
+    args = parser.parse_args(argv)
+    run(workers=args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+import os
+import re
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import profiling
+
+PROCESSED_DATA_PATH = "data/processed"
+# Parquet partitions, one per monthly source file, laid out as
+# year=YYYY/month=MM/<source name>.parquet
+TRIPS_PATH = os.path.join(PROCESSED_DATA_PATH, "trips")
+
+# Rows per Parquet row group; small enough that date filters can skip
+# parts of a month using the start_time statistics
+ROW_GROUP_SIZE = 100_000
+
+PARTITION_DIR_PATTERN = re.compile(r"year=(\d{4})[\\/]month=(\d{2})")
+SOURCE_MONTH_PATTERN = re.compile(r"(\d{4})[-_](\d{2})(?!\d)")
+
+# Timestamp format of the ridership CSVs; months that differ fall back to inference
+SOURCE_TIME_FORMAT = "%m/%d/%Y %H:%M"
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August",
+               "September", "October", "November", "December"]
+# Calendar fields of start_time, stored as small integers at ingest
+TIME_FEATURES = ["year", "month", "day_of_week", "hour"]
+
+# Fixed schema of the processed trip store
+TRIP_SCHEMA = {
+    "trip_id": "Int64",
+    "trip_duration": "Int32",
+    "start_station_id": "Int32",
+    "start_time": "datetime64[ns]",
+    "start_station_name": "category",
+    "end_station_id": "Int32",
+    "end_time": "datetime64[ns]",
+    "end_station_name": "category",
+    "bike_id": "Int32",
+    "user_type": "category",
+    # Dense station codes from station_dictionary, added at ingest
+    "start_station_code": "int32",
+    "end_station_code": "int32",
+    # Calendar fields of start_time (day_of_week: 0 = Monday, month: 1-12)
+    "year": "uint16",
+    "month": "uint8",
+    "day_of_week": "uint8",
+    "hour": "uint8",
+}
+
+# Arrow types of the same schema; category columns share one dictionary index
+# width so partitions and streamed chunks always have identical schemas
+ARROW_TYPES = {
+    "Int64": pa.int64(),
+    "Int32": pa.int32(),
+    "int32": pa.int32(),
+    "uint16": pa.uint16(),
+    "uint8": pa.uint8(),
+    "datetime64[ns]": pa.timestamp("ns"),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+}
+
+# Rows missing any of these cannot be used by the analysis scripts
+REQUIRED_COLUMNS = [
+    "trip_duration", "start_time", "end_time",
+    "start_station_name", "end_station_name", "user_type",
+]
+
+# dtypes used when parsing the raw CSVs, so pandas never has to infer them.
+# Numbers and timestamps are read as strings and converted by apply_schema, so
+# a malformed cell becomes a missing value (and a reject) instead of failing the month.
+READ_DTYPES = {
+    col: ("category" if dtype == "category" else "string")
+    for col, dtype in TRIP_SCHEMA.items()
+}
+
+def normalize_columns(columns):
+    """Standardize raw CSV headers, e.g. 'ï»¿Trip  Duration' -> 'trip_duration'."""
+    return (
+        pd.Index(columns)
+        .str.strip()
+        .str.lower()
+        .str.replace('ï»¿', '')
+        .str.replace(' ', '_')
+        .str.replace('__', '_')
+    )
+
+def apply_schema(df):
+    """Cast a normalized trip DataFrame to TRIP_SCHEMA, dropping unknown columns."""
+    out = pd.DataFrame(index=df.index)
+    for col, dtype in TRIP_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        if dtype.startswith("datetime"):
+            out[col] = parse_times(df[col])
+        elif dtype == "category":
+            out[col] = df[col].astype("category")
+        else:
+            out[col] = pd.to_numeric(df[col], errors="coerce").round().astype(dtype)
+    return out
+
+def parse_times(values):
+    """Parse raw timestamps with the known source format.
+
+    Rows that do not match it (e.g. a month exported with another format)
+    get a second pass with the format inferred; the rest become NaT.
+    """
+    with profiling.step("to_datetime", rows=len(values)):
+        parsed = pd.to_datetime(values, format=SOURCE_TIME_FORMAT, errors="coerce")
+        failed = parsed.isna() & values.notna()
+        if failed.any():
+            parsed[failed] = pd.to_datetime(values[failed], errors="coerce")
+    return parsed.astype("datetime64[ns]")
+
+def time_features(start_time):
+    """year / month / day_of_week / hour of each start time as compact integers."""
+    return {
+        "year": start_time.dt.year.astype("uint16"),
+        "month": start_time.dt.month.astype("uint8"),
+        "day_of_week": start_time.dt.dayofweek.astype("uint8"),
+        "hour": start_time.dt.hour.astype("uint8"),
+    }
+
+def with_time_features(df):
+    """Add the stored calendar columns to valid trips (start_time must be present)."""
+    return df.assign(**time_features(df["start_time"]))
+
+def drop_invalid_trips(df):
+    """Drop rows with missing required fields or non-positive durations.
+
+    Returns the kept rows and a dict of reject counts by reason; each rejected
+    row is counted once, under the first reason it fails.
+    """
+    invalid = pd.Series(False, index=df.index)
+    rejects = {}
+    for col in REQUIRED_COLUMNS:
+        if col in df.columns:
+            missing = df[col].isna() & ~invalid
+            rejects[f"missing_{col}"] = int(missing.sum())
+            invalid |= missing
+    if "trip_duration" in df.columns:
+        non_positive = (df["trip_duration"] <= 0).fillna(False) & ~invalid
+        rejects["non_positive_duration"] = int(non_positive.sum())
+        invalid |= non_positive
+    return df[~invalid], rejects
+
+def to_arrow(df):
+    schema = pa.schema([(col, ARROW_TYPES[TRIP_SCHEMA[col]]) for col in df.columns])
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def partition_key(name, start_time=None):
+    """(year, month) a monthly source belongs to.
+
+    Taken from the source name (e.g. "Bike share ridership 2023-01"), or
+    else from the most common start month of its trips.
+    """
+    match = SOURCE_MONTH_PATTERN.search(name)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    if start_time is None or start_time.dropna().empty:
+        raise ValueError(f"Cannot tell which month {name} holds")
+    period = start_time.dt.to_period("M").mode()[0]
+    return period.year, period.month
+
+def partition_path(name, output_dir=TRIPS_PATH, key=None):
+    year, month = key or partition_key(name)
+    directory = os.path.join(output_dir, f"year={year}", f"month={month:02d}")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}.parquet")
+
+def write_partition(df, name, output_dir=TRIPS_PATH):
+    """Write one partition of the trip store, ordered by start time, and return its path."""
+    key = partition_key(name, df.get("start_time"))
+    output_path = partition_path(name, output_dir, key)
+    if "start_time" in df.columns:
+        df = df.sort_values("start_time", kind="stable")
+    pq.write_table(to_arrow(df), output_path, row_group_size=ROW_GROUP_SIZE)
+    return output_path
+
+def sort_partition(source_path, output_path, max_rows):
+    """Write a partition ordered by start time while holding about max_rows trips at once.
+
+    The month is split into start_time ranges of at most max_rows trips, found
+    from its start_time column alone; each range is then read with a filter
+    (skipping row groups outside it), sorted and appended.
+    """
+    dataset = ds.dataset(source_path, format="parquet")
+    times = np.sort(dataset.to_table(columns=["start_time"]).column("start_time").to_numpy())
+    bounds = [None] + list(np.unique(times[max_rows::max_rows])) + [None]
+    writer = pq.ParquetWriter(output_path, dataset.schema)
+    try:
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            table = dataset.to_table(filter=trip_filter(start, end)).sort_by("start_time")
+            writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+    finally:
+        writer.close()
+
+def replace_store(staging_dir, output_dir=TRIPS_PATH):
+    """Swap a fully written staging directory in for the trip store."""
+    old_dir = output_dir.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(staging_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def add_time_features(df):
+    """Label the stored calendar columns: day_of_week and month become ordered
+    categoricals of day / month names, built from the codes without touching
+    start_time. Frames read without those columns get them from start_time."""
+    if "start_time" in df.columns and not any(col in df.columns for col in TIME_FEATURES):
+        df = with_time_features(df)
+    labels = {}
+    if "day_of_week" in df.columns and not isinstance(df["day_of_week"].dtype, pd.CategoricalDtype):
+        labels["day_of_week"] = pd.Categorical.from_codes(df["day_of_week"].to_numpy("int8"), DAY_NAMES, ordered=True)
+    if "month" in df.columns and not isinstance(df["month"].dtype, pd.CategoricalDtype):
+        labels["month"] = pd.Categorical.from_codes(df["month"].to_numpy("int8") - 1, MONTH_NAMES, ordered=True)
+    return df.assign(**labels)
+
+def list_partitions(path=TRIPS_PATH):
+    """Map partition name -> file path for every partition in the trip store, oldest month first."""
+    partitions = []
+    for directory, _, files in os.walk(path):
+        for file in files:
+            if file.endswith(".parquet"):
+                file_path = os.path.join(directory, file)
+                partitions.append((partition_month(file_path), file, file_path))
+    return {os.path.splitext(file)[0]: file_path for _, file, file_path in sorted(partitions)}
+
+def partition_month(file_path):
+    """(year, month) of a partition file from its year=/month= directories."""
+    match = PARTITION_DIR_PATTERN.search(file_path)
+    return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+def partition_time_range(file_path):
+    """(first, last) start_time of a partition from the row group statistics in
+    its Parquet footer, or None if it has none (e.g. an empty partition)."""
+    metadata = pq.read_metadata(file_path)
+    if "start_time" not in metadata.schema.names:
+        return None
+    column = metadata.schema.names.index("start_time")
+    ranges = []
+    for i in range(metadata.num_row_groups):
+        if metadata.row_group(i).num_rows == 0:
+            continue
+        statistics = metadata.row_group(i).column(column).statistics
+        if statistics is None or not statistics.has_min_max:
+            return None
+        ranges.append((statistics.min, statistics.max))
+    if not ranges:
+        return None
+    return min(first for first, _ in ranges), max(last for _, last in ranges)
+
+def select_partitions(path=TRIPS_PATH, start=None, end=None):
+    """Partition files that can hold trips starting in [start, end).
+
+    Pruning uses the start_time range each file records in its footer, not
+    its year=/month= directory, so a source filed under one month (e.g. a
+    quarterly file filed under its most common month) is found for the others.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    selected = []
+    for file_path in list_partitions(path).values():
+        time_range = partition_time_range(file_path) if start is not None or end is not None else None
+        if time_range is not None and ((start is not None and time_range[1] < start)
+                                       or (end is not None and time_range[0] >= end)):
+            continue
+        selected.append(file_path)
+    return selected
+
+def trip_filter(start=None, end=None, user_types=None):
+    """pyarrow filter for start <= start_time < end and the given user types."""
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("start_time") >= pa.scalar(pd.Timestamp(start), type=pa.timestamp("ns")))
+    if end is not None:
+        conditions.append(ds.field("start_time") < pa.scalar(pd.Timestamp(end), type=pa.timestamp("ns")))
+    if user_types is not None:
+        conditions.append(ds.field("user_type").isin(list(user_types)))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def load_trips(columns=None, path=TRIPS_PATH, start=None, end=None, user_types=None):
+    """Load the processed trips, reading only the requested columns.
+
+    start/end (start <= start_time < end) and user_types restrict the trips.
+    Partitions whose start_time range lies outside the dates are never read
+    (only their footers are), and within the remaining files, row groups
+    whose start_time statistics fall outside it are skipped.
+    """
+    files = select_partitions(path, start, end)
+    if not files:
+        return pd.DataFrame({col: pd.Series(dtype=TRIP_SCHEMA[col]) for col in (columns or TRIP_SCHEMA)})
+    dataset = ds.dataset(files, format="parquet")
+    table = dataset.to_table(columns=columns, filter=trip_filter(start, end, user_types))
+    return table.to_pandas()
@@ -1,46 +1,146 @@
 import pandas as pd
 import requests
 import time
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from trip_store import TRIPS_PATH, load_trips
 
-RAW_DATA_PATH = "data/processedbikeshare_2023_combined.csv"
+RAW_DATA_PATH = TRIPS_PATH
 GEO_OUTPUT_PATH = "data/raw/stations_with_coords.csv"
 CLEAN_OUTPUT_PATH = "data/processed/stations_with_coords_clean.csv"
+GEOCODE_CACHE_PATH = "data/raw/geocode_cache.sqlite"
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
 USER_AGENT = "Toronto-Bike-Project"
 
-def geocode_station(name):
-    """Geocode a station name using OpenStreetMap's Nominatim API."""
-    try:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": f"{name}, Toronto, Canada",
-            "format": "json",
-            "limit": 1
-        }
-        headers = {"User-Agent": USER_AGENT}
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        if data:
-            return float(data[0]["lat"]), float(data[0]["lon"])
-    except Exception as e:
-        print(f"Failed to geocode '{name}': {e}")
+def lookup_station(name, session=None, url=NOMINATIM_URL):
+    """Query Nominatim for one station; returns (None, None) when nothing matches.
+
+    HTTP and network errors are raised so callers can tell them apart from a
+    genuine "no match" and retry later.
+    """
+    params = {
+        "q": f"{name}, Toronto, Canada",
+        "format": "json",
+        "limit": 1
+    }
+    headers = {"User-Agent": USER_AGENT}
+    response = (session or requests).get(url, params=params, headers=headers, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    if data:
+        return float(data[0]["lat"]), float(data[0]["lon"])
     return None, None
 
 def extract_unique_stations(path):
-    df = pd.read_csv(path)
+    df = load_trips(columns=["start_station_name", "end_station_name"], path=path)
     stations = pd.concat([df["start_station_name"], df["end_station_name"]]).dropna().unique()
     return pd.DataFrame({"station_name": sorted(stations)})
 
-def geocode_stations(df):
-    df["latitude"] = None
-    df["longitude"] = None
+class TokenBucket:
+    """Thread-safe token bucket: at most `rate` acquisitions per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class GeocodeCache:
+    """On-disk geocode results keyed by normalized station name.
+
+    A row with NULL coordinates records a lookup that found no match, so it
+    is not repeated on the next run.
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "normalized_name TEXT PRIMARY KEY, station_name TEXT, latitude REAL, longitude REAL, looked_up_at REAL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def normalize(name):
+        return " ".join(str(name).lower().split())
+
+    def get_all(self):
+        rows = self.conn.execute("SELECT normalized_name, latitude, longitude FROM geocode").fetchall()
+        return {name: (lat, lon) for name, lat, lon in rows}
+
+    def put(self, station_name, lat, lon):
+        # Committed per station, so an interrupted run resumes where it stopped
+        self.conn.execute(
+            "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)",
+            (self.normalize(station_name), station_name, lat, lon, time.time()),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
 
-    for i, row in df.iterrows():
-        lat, lon = geocode_station(row["station_name"])
-        df.at[i, "latitude"] = lat
-        df.at[i, "longitude"] = lon
-        print(f"{row['station_name']} → ({lat}, {lon})")
-        time.sleep(1)  # Respect rate limit
+def geocode_stations(df, cache_path=GEOCODE_CACHE_PATH, workers=1, rate=1.0, url=NOMINATIM_URL, retry_missing=False):
+    """Fill latitude/longitude for every station, geocoding only names not already cached.
+
+    Lookups run on `workers` threads, each reusing one HTTP session, and are
+    throttled to `rate` requests per second overall. The public Nominatim
+    server allows one request per second; raise both against a self-hosted one.
+    """
+    cache = GeocodeCache(cache_path)
+    try:
+        cached = cache.get_all()
+        names = set(df["station_name"])
+        todo = sorted(
+            name for name in names
+            if GeocodeCache.normalize(name) not in cached
+            or (retry_missing and cached[GeocodeCache.normalize(name)][0] is None)
+        )
+        print(f"{len(names) - len(todo)} station(s) cached, {len(todo)} to geocode")
+
+        bucket = TokenBucket(rate)
+        sessions = threading.local()
+
+        def lookup(name):
+            if not hasattr(sessions, "session"):
+                sessions.session = requests.Session()
+            bucket.acquire()
+            return lookup_station(name, sessions.session, url)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(lookup, name): name for name in todo}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    lat, lon = future.result()
+                except Exception as e:
+                    # Not cached, so the next run retries it
+                    print(f"Failed to geocode '{name}': {e}")
+                    continue
+                cache.put(name, lat, lon)
+                print(f"{name} → ({lat}, {lon})")
+
+        cached = cache.get_all()
+    finally:
+        cache.close()
+
+    coords = df["station_name"].map(lambda name: cached.get(GeocodeCache.normalize(name), (None, None)))
+    df["latitude"] = [lat for lat, _ in coords]
+    df["longitude"] = [lon for _, lon in coords]
     return df
 
 def fix_coordinate_format(row):
@@ -65,16 +165,28 @@ def clean_coordinates(df):
     df = df.dropna(subset=["latitude", "longitude"])
     return df
 
-if __name__ == "__main__":
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Geocode trip stations with Nominatim.")
+    parser.add_argument("--url", default=NOMINATIM_URL, help="Nominatim search endpoint")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent lookups")
+    parser.add_argument("--rate", type=float, default=1.0, help="Maximum requests per second")
+    parser.add_argument("--retry-missing", action="store_true",
+                        help="Look up again stations that previously returned no match")
+    args = parser.parse_args(argv)
+
     print("Extracting unique stations...")
     station_df = extract_unique_stations(RAW_DATA_PATH)
 
     print("Geocoding station coordinates...")
-    station_df = geocode_stations(station_df)
+    station_df = geocode_stations(station_df, workers=args.workers, rate=args.rate,
+                                  url=args.url, retry_missing=args.retry_missing)
     station_df.to_csv(GEO_OUTPUT_PATH, index=False)
     print(f"Geocoded stations saved to: {GEO_OUTPUT_PATH}")
 
     print("Cleaning up coordinate formatting...")
     cleaned_df = clean_coordinates(pd.read_csv(GEO_OUTPUT_PATH))
     cleaned_df.to_csv(CLEAN_OUTPUT_PATH, index=False)
-    print(f"Cleaned coordinates saved to: {CLEAN_OUTPUT_PATH}")
\ No newline at end of file
+    print(f"Cleaned coordinates saved to: {CLEAN_OUTPUT_PATH}")
+
+if __name__ == "__main__":
+    main()